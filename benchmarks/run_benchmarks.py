@@ -0,0 +1,153 @@
+# Copyright 2018 BLEMUNDSBURY AI LIMITED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmarks of the responder pipeline on synthetic corpora, using the in-memory stand-ins of benchmarks/stubs.py
+so that neither a GPU, the document database nor the network are needed.
+
+    python benchmarks/run_benchmarks.py --chunks 10 1000 100000 --backends dummy local dask
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from functools import partial
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from cape_responder import responder_core, task_manager
+from cape_responder.responder_core import Responder
+from cape_responder.task_manager import DummyClient, LocalProcessClient
+import stubs
+
+USER_TOKEN = 'benchmark-user'
+QUESTION = 'What is w42 ?'
+
+
+def build_corpus(number_of_chunks: int, chunks_per_document: int, seed: int):
+    stubs.InMemoryDocumentStore.clear()
+    random_state = np.random.RandomState(seed)
+    remaining = number_of_chunks
+    document_idx = 0
+    while remaining > 0:
+        document_chunks = min(remaining, chunks_per_document)
+        text = stubs.synthetic_text(document_chunks * stubs.InMemoryDocumentStore.chunk_words, random_state)
+        stubs.InMemoryDocumentStore.create_document(USER_TOKEN, 'Synthetic', 'benchmark', text,
+                                                    document_id='doc{}'.format(document_idx))
+        remaining -= document_chunks
+        document_idx += 1
+
+
+def connect_backend(backend: str, workers: int):
+    if backend == 'dummy':
+        client = DummyClient()
+    elif backend == 'local':
+        # Worker processes are forked after stubs.install so they inherit the fake machine reader
+        client = LocalProcessClient(workers)
+    elif backend == 'dask':
+        from dask.distributed import Client, LocalCluster
+        client = Client(LocalCluster(n_workers=1, threads_per_worker=workers, processes=False))
+    else:
+        raise ValueError('Unknown backend {}'.format(backend))
+    task_manager.CLUSTER_CLIENT = client
+    return client
+
+
+def measure(funct, repeats: int, measure_memory: bool) -> dict:
+    funct()  # warm up
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(repeats):
+        tic = time.perf_counter()
+        funct()
+        latencies.append(time.perf_counter() - tic)
+    elapsed = time.perf_counter() - start
+    result = {
+        'throughput_per_second': repeats / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50)) * 1000,
+        'p99_ms': float(np.percentile(latencies, 99)) * 1000,
+    }
+    if measure_memory:
+        tracemalloc.start()
+        funct()
+        result['peak_memory_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return result
+
+
+def reduce_inputs(number_of_items: int):
+    chunks = Responder.find_chunks(USER_TOKEN, QUESTION, None, None, None)
+    worker_chunks = Responder.partition_chunks(chunks, 8)
+    future_answers = [Responder.machine_reader_logits(QUESTION, chunk_slice) for chunk_slice in worker_chunks]
+    configuration = Responder.get_machine_reader_configuration(0, number_of_items)
+    return future_answers, configuration, worker_chunks
+
+
+def translate_inputs(future_answers, worker_chunks, number_of_spans: int, seed: int):
+    _, _, flat_text, positions = Responder.combine_chunks(future_answers, worker_chunks)
+    random_state = np.random.RandomState(seed)
+    starts = random_state.randint(1, len(flat_text) - 10, size=number_of_spans)
+    answer_spans = [(start, start + 5) for start in starts.tolist()]
+    context_spans = [(max(start - 50, 0), min(start + 55, len(flat_text))) for start in starts.tolist()]
+    return answer_spans, context_spans, positions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chunks', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--chunks-per-document', type=int, default=50)
+    parser.add_argument('--backends', nargs='+', default=['dummy', 'local'], choices=['dummy', 'local', 'dask'])
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--number-of-items', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--memory', action='store_true', help='Also report the peak memory allocated by one run')
+    parser.add_argument('--json', action='store_true', help='Print one JSON line per result instead of a table')
+    args = parser.parse_args()
+
+    stubs.install(responder_core, args.seed)
+    clients = {backend: connect_backend(backend, args.workers) for backend in args.backends}
+    results = []
+    for number_of_chunks in args.chunks:
+        build_corpus(number_of_chunks, args.chunks_per_document, args.seed)
+        for backend, client in clients.items():
+            task_manager.CLUSTER_CLIENT = client
+            answer = partial(Responder.get_answers_from_documents, USER_TOKEN, QUESTION,
+                             number_of_items=args.number_of_items, speed_or_accuracy='total')
+            results.append(dict(benchmark='get_answers_from_documents', backend=backend, chunks=number_of_chunks,
+                                **measure(answer, args.repeats, args.memory)))
+        future_answers, configuration, worker_chunks = reduce_inputs(args.number_of_items)
+        reduce = partial(Responder.reduce_results, future_answers, configuration, worker_chunks)
+        results.append(dict(benchmark='reduce_results', backend='in-process', chunks=number_of_chunks,
+                            **measure(reduce, args.repeats, args.memory)))
+        translate = partial(Responder.translate_spans,
+                            *translate_inputs(future_answers, worker_chunks, args.number_of_items, args.seed))
+        results.append(dict(benchmark='translate_spans', backend='in-process', chunks=number_of_chunks,
+                            **measure(translate, args.repeats, args.memory)))
+        for result in results[-len(clients) - 2:]:
+            if args.json:
+                print(json.dumps(result))
+            else:
+                print('{benchmark:<28} {backend:<10} {chunks:>7} chunks  {throughput_per_second:>10.1f}/s  '
+                      'p50 {p50_ms:>9.2f}ms  p99 {p99_ms:>9.2f}ms'.format(**result)
+                      + ('  peak {:.1f}MB'.format(result['peak_memory_mb']) if args.memory else ''))
+            sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+# Copyright 2018 BLEMUNDSBURY AI LIMITED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""In-memory stand-ins for the document store, the annotation store and the machine reader used by the benchmarks."""
+
+import json
+import re
+import zlib
+from collections import OrderedDict
+from typing import List, Optional
+import numpy as np
+from cape_responder.chunking import chunk_text
+
+_WORD = re.compile(r'\S+')
+
+
+class FakeSearchResult:
+    def __init__(self, chunk):
+        self.matched_content = chunk.text
+        self._fields = {
+            'document_id': chunk.document_id,
+            'text_span': json.dumps(list(chunk.text_span)),
+            'overlap_before': chunk.overlap_before,
+            'overlap_after': chunk.overlap_after,
+            'embedding': chunk.embedding,
+        }
+
+    def get_indexable_string_fields(self):
+        return self._fields
+
+
+class InMemoryDocumentStore:
+    """Keeps chunked documents in a dict, search returns each document's chunks in order."""
+    chunk_words = 100
+    _documents = OrderedDict()
+
+    @staticmethod
+    def create_document(user_token: str, title: str, origin: str, text: str, document_id: str = None,
+                        replace: bool = False, get_embedding=None):
+        chunks = chunk_text(document_id, text, InMemoryDocumentStore.chunk_words, 10)
+        if get_embedding is not None:
+            for chunk in chunks:
+                chunk.embedding = get_embedding(chunk.text)
+        InMemoryDocumentStore._documents[(user_token, document_id)] = [FakeSearchResult(chunk) for chunk in chunks]
+        return document_id
+
+    @staticmethod
+    def delete_document(user_token: str, document_id: str):
+        InMemoryDocumentStore._documents.pop((user_token, document_id), None)
+
+    @staticmethod
+    def get_documents(user_token: str):
+        return [{'id': document_id} for user, document_id in InMemoryDocumentStore._documents if user == user_token]
+
+    @staticmethod
+    def search_chunks(user_token: str, question: str, document_ids: Optional[List[str]] = None,
+                      limit_per_doc: Optional[int] = None):
+        for (user, document_id), results in InMemoryDocumentStore._documents.items():
+            if user == user_token and (document_ids is None or document_id in document_ids):
+                yield from results[:limit_per_doc]
+
+    @staticmethod
+    def clear():
+        InMemoryDocumentStore._documents.clear()
+
+
+class InMemoryAnnotationStore:
+    @staticmethod
+    def similar_annotations(user_token: str, question: str, document_ids=None, saved_replies=None):
+        return []
+
+
+class FakeAnswer:
+    def __init__(self, text, long_text, score_reader, span, long_text_span):
+        self.text = text
+        self.long_text = long_text
+        self.score_reader = score_reader
+        self.span = span
+        self.long_text_span = long_text_span
+
+
+class FakeMachineReader:
+    """
+    Emits deterministic random logits, one per whitespace token, and picks single token answers.
+    Tokens of the combined text line up with the concatenated logits since chunks are joined by spaces.
+    """
+
+    def __init__(self, seed: int = 0, context_chars: int = 100):
+        self.seed = seed
+        self.context_chars = context_chars
+
+    def get_document_embedding(self, text: str) -> np.ndarray:
+        return np.random.RandomState(self.seed).rand(len(_WORD.findall(text)), 8)
+
+    def get_logits(self, context, question, overlap_before, overlap_after, document_embedding=None):
+        number_of_tokens = len(_WORD.findall(context))
+        random_state = np.random.RandomState(zlib.crc32((question + '\n' + context).encode('utf-8')) ^ self.seed)
+        return (random_state.randn(number_of_tokens), random_state.randn(number_of_tokens)), (0, 0)
+
+    def get_answers_from_logits(self, configuration, logits, overlaps, text):
+        scores = np.concatenate([start + end for (start, end) in logits]) if logits else np.zeros(0)
+        token_spans = [match.span() for match in _WORD.finditer(text)]
+        top_k = min(configuration.top_k, len(scores))
+        answers = []
+        for token_idx in np.argsort(-scores, kind='stable')[:top_k]:
+            span = token_spans[token_idx]
+            long_text_span = (max(span[0] - self.context_chars, 0), min(span[1] + self.context_chars, len(text)))
+            answers.append(FakeAnswer(text[span[0]:span[1]], text[long_text_span[0]:long_text_span[1]],
+                                      1 / (1 + np.exp(-scores[token_idx])), span, long_text_span))
+        return answers
+
+
+def synthetic_text(number_of_words: int, random_state: np.random.RandomState, vocabulary_size: int = 5000) -> str:
+    word_ids = random_state.randint(vocabulary_size, size=number_of_words)
+    return ' '.join('w{}'.format(word_id) for word_id in word_ids)
+
+
+def install(responder_core, seed: int = 0):
+    """Points the responder at the in-memory stand-ins."""
+    responder_core.DocumentStore = InMemoryDocumentStore
+    responder_core.AnnotationStore = InMemoryAnnotationStore
+    responder_core.Responder._MACHINE_READER = FakeMachineReader(seed)
@@ -0,0 +1,157 @@
+# Copyright 2018 BLEMUNDSBURY AI LIMITED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import Future
+from threading import Lock
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+
+class LRUCache:
+    """Thread safe, bounded least recently used cache with hit/miss counters and optional expiry in seconds."""
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key: Hashable):
+        return key in self._items
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            try:
+                expires_at, value = self._items[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._items[key]
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._items[key] = (expires_at, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]):
+        """Return the cached value for key, computing and storing it on a miss."""
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def pop(self, key: Hashable, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            return self._items.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._items),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+def normalise_question(question: str) -> str:
+    """Collapse whitespace so that trivially different spellings of a question share cache entries."""
+    return ' '.join(question.split())
+
+
+class DocumentVersions:
+    """
+    Per process version counters of users' documents, used to build cache keys that stop matching as soon as one
+    of the documents they cover is created, replaced or deleted.
+    """
+
+    def __init__(self):
+        self._user_versions = defaultdict(int)
+        self._document_versions = defaultdict(int)
+        self._lock = Lock()
+
+    def bump(self, user_token: str, document_ids: Iterable[str]):
+        with self._lock:
+            # Searches over all of a user's documents depend on every document
+            self._user_versions[user_token] += 1
+            for document_id in document_ids:
+                self._document_versions[(user_token, document_id)] += 1
+
+    def key(self, user_token: str, document_ids: Optional[Iterable[str]]) -> Tuple:
+        if document_ids is None:
+            return (None, self._user_versions.get(user_token, 0))
+        return tuple((document_id, self._document_versions.get((user_token, document_id), 0))
+                     for document_id in sorted(set(document_ids)))
+
+
+class SingleFlight:
+    """
+    Runs concurrent calls sharing a key only once: callers arriving while the call is in flight wait for it and get
+    its result, or its exception. Nothing is kept once the call completes.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._calls)
+
+    def do(self, key: Hashable, compute: Callable[[], Any]):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result()
+        try:
+            result = compute()
+        except BaseException as exception:
+            with self._lock:
+                del self._calls[key]
+            future.set_exception(exception)
+            raise
+        with self._lock:
+            del self._calls[key]
+        future.set_result(result)
+        return result
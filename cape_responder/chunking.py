@@ -0,0 +1,46 @@
+# Copyright 2018 BLEMUNDSBURY AI LIMITED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+from typing import List
+from cape_responder.objects.chunk import Chunk
+
+_WORD = re.compile(r'\S+')
+_TERM = re.compile(r'\w+')
+
+
+def chunk_text(document_id: str, text: str, chunk_words: int, overlap_words: int) -> List[Chunk]:
+    """Splits the text in chunks of chunk_words words, with up to overlap_words words of context on each side."""
+    words = [match.span() for match in _WORD.finditer(text)]
+    chunks = []
+    for first_word in range(0, len(words), chunk_words):
+        last_word = min(first_word + chunk_words, len(words)) - 1
+        start, end = words[first_word][0], words[last_word][1]
+        overlap_start = words[max(first_word - overlap_words, 0)][0]
+        overlap_end = words[min(last_word + overlap_words, len(words) - 1)][1]
+        chunks.append(Chunk(document_id, text[start:end], (start, end), text[overlap_start:start],
+                            text[end:overlap_end]))
+    return chunks
+
+
+def terms(text: str) -> set:
+    return set(_TERM.findall(text.lower()))
+
+
+def lexical_overlap_scores(question: str, texts: List[str]) -> List[float]:
+    """Fraction of the question's terms found in each text."""
+    question_terms = terms(question)
+    if not question_terms:
+        return [0.0] * len(texts)
+    return [len(question_terms & terms(text)) / len(question_terms) for text in texts]
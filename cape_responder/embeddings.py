@@ -0,0 +1,83 @@
+# Copyright 2018 BLEMUNDSBURY AI LIMITED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import struct
+from base64 import b64decode, b64encode
+import numpy as np
+
+# Layout: magic, format version, dtype code, number of dimensions, then one uint32 per dimension and the raw data.
+# int8 embeddings are quantised per vector along the last dimension, their float32 scales precede the data.
+_MAGIC = b'CEMB'
+_FORMAT_VERSION = 1
+_HEADER = struct.Struct('<4sBBH')
+_DIMENSION = struct.Struct('<I')
+_DTYPE_TO_CODE = {'float16': 0, 'float32': 1, 'int8': 2}
+_CODE_TO_DTYPE = {code: np.dtype(dtype).newbyteorder('<') for dtype, code in _DTYPE_TO_CODE.items()}
+_INT8_CODE = _DTYPE_TO_CODE['int8']
+_SCALE_DTYPE = np.dtype('<f4')
+
+
+def quantise(embedding: np.ndarray):
+    """Symmetric int8 quantisation of each vector along the last dimension, returns the int8 values and scales."""
+    array = np.asarray(embedding, dtype=np.float32)
+    scales = np.abs(array).max(axis=-1, keepdims=True) / 127 if array.size else np.ones(array.shape[:-1] + (1,))
+    scales = np.where(scales > 0, scales, 1).astype(_SCALE_DTYPE)
+    return np.rint(array / scales).astype(np.int8), scales
+
+
+def encode_embedding(embedding: np.ndarray, dtype: str = 'float32') -> bytes:
+    """Serialise an embedding to the compact binary format."""
+    if dtype not in _DTYPE_TO_CODE:
+        raise ValueError('Embedding dtype {} not supported'.format(dtype))
+    scales = b''
+    if dtype == 'int8':
+        array, scales = quantise(embedding)
+        scales = np.ascontiguousarray(scales).tobytes()
+    else:
+        array = np.ascontiguousarray(embedding, dtype=_CODE_TO_DTYPE[_DTYPE_TO_CODE[dtype]])
+    header = _HEADER.pack(_MAGIC, _FORMAT_VERSION, _DTYPE_TO_CODE[dtype], array.ndim)
+    shape = b''.join(_DIMENSION.pack(dimension) for dimension in array.shape)
+    return header + shape + scales + array.tobytes()
+
+
+def decode_embedding(buffer) -> np.ndarray:
+    """
+    Return a read only view of an embedding serialised by encode_embedding, no data is copied.
+    int8 embeddings are returned dequantised to float32.
+    """
+    magic, version, dtype_code, ndim = _HEADER.unpack_from(buffer)
+    if magic != _MAGIC or version != _FORMAT_VERSION:
+        raise ValueError('Not an embedding buffer')
+    shape = tuple(_DIMENSION.unpack_from(buffer, _HEADER.size + idx * _DIMENSION.size)[0] for idx in range(ndim))
+    offset = _HEADER.size + ndim * _DIMENSION.size
+    if dtype_code == _INT8_CODE:
+        scales_shape = shape[:-1] + (1,)
+        scales = np.frombuffer(buffer, dtype=_SCALE_DTYPE, count=int(np.prod(scales_shape)), offset=offset)
+        offset += scales.nbytes
+        values = np.frombuffer(buffer, dtype=np.int8, offset=offset).reshape(shape)
+        return values * scales.reshape(scales_shape)
+    return np.frombuffer(buffer, dtype=_CODE_TO_DTYPE[dtype_code], offset=offset).reshape(shape)
+
+
+def embedding_to_field(embedding: np.ndarray, dtype: str = 'float32') -> str:
+    """Serialise an embedding for storage in an indexable string field."""
+    return b64encode(encode_embedding(embedding, dtype)).decode('ascii')
+
+
+def embedding_from_field(field: str) -> np.ndarray:
+    """Parse an embedding field, accepting the binary format as well as the legacy JSON lists."""
+    if field.startswith('['):
+        return np.asarray(json.loads(field))
+    return decode_embedding(b64decode(field))
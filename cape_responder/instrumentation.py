@@ -0,0 +1,254 @@
+# Copyright 2018 BLEMUNDSBURY AI LIMITED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import time
+from collections import defaultdict
+from functools import wraps
+from logging import info
+from threading import Lock, local
+from typing import Callable, Dict, List, Optional, Tuple
+from cape_responder.responder_settings import INSTRUMENTATION_ENABLED
+
+ENABLED = INSTRUMENTATION_ENABLED
+_EXPORTERS: List[Callable[[dict], None]] = []
+_LOCK = Lock()
+_STAGE_COUNTS = defaultdict(int)
+_STAGE_SECONDS = defaultdict(float)
+_STAGE_MAX_SECONDS = defaultdict(float)
+_COUNTERS = defaultdict(float)
+_CURRENT = local()
+
+
+def enable():
+    global ENABLED
+    ENABLED = True
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def add_exporter(exporter: Callable[[dict], None]):
+    """Registers a callback receiving the record of every instrumented request once it completes."""
+    _EXPORTERS.append(exporter)
+
+
+def remove_exporter(exporter: Callable[[dict], None]):
+    _EXPORTERS.remove(exporter)
+
+
+def log_exporter(record: dict):
+    """Exporter writing each request record as one structured log line."""
+    info('cape_responder_request ' + json.dumps(record, sort_keys=True))
+
+
+class _NullContext:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_CONTEXT = _NullContext()
+
+
+class TaskResult:
+    """
+    Result of a task run by run_task outside of any request, with the stages and counters it recorded and the
+    seconds of its critical path: the task itself and the longest chain of the tasks it took the results of.
+    """
+    __slots__ = ('value', 'stages', 'counters', 'critical_seconds')
+
+    def __init__(self):
+        self.value = None
+        self.stages: List[Tuple[str, float]] = []
+        self.counters: Dict[str, float] = defaultdict(float)
+        self.critical_seconds = 0.
+
+
+def _add_stage(name: str, seconds: float):
+    task = getattr(_CURRENT, 'task', None)
+    if task is not None:
+        # Recorded where the task's result is awaited, see task_result
+        task.stages.append((name, seconds))
+        return
+    with _LOCK:
+        _STAGE_COUNTS[name] += 1
+        _STAGE_SECONDS[name] += seconds
+        _STAGE_MAX_SECONDS[name] = max(_STAGE_MAX_SECONDS[name], seconds)
+    record = getattr(_CURRENT, 'record', None)
+    if record is not None:
+        record['stages'][name] = record['stages'].get(name, 0.) + seconds
+
+
+class _Stage:
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        _add_stage(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _Request(_Stage):
+    def __enter__(self):
+        self.parent = getattr(_CURRENT, 'record', None)
+        _CURRENT.record = {'request': self.name, 'stages': {}, 'counters': {}}
+        return super().__enter__()
+
+    def __exit__(self, *exc_info):
+        record = _CURRENT.record
+        super().__exit__(*exc_info)
+        _CURRENT.record = self.parent
+        record['seconds'] = record['stages'].pop(self.name)
+        record['failed'] = exc_info[0] is not None
+        for exporter in list(_EXPORTERS):
+            exporter(record)
+        return False
+
+
+def stage(name: str):
+    """Context manager timing a stage of the current request, a no-op while instrumentation is disabled."""
+    if not ENABLED:
+        return _NULL_CONTEXT
+    return _Stage(name)
+
+
+def request(name: str):
+    """Context manager timing a whole request and passing its record to the exporters when it completes."""
+    if not ENABLED:
+        return _NULL_CONTEXT
+    return _Request(name)
+
+
+def count(name: str, value: float = 1):
+    """Adds value to a counter, such as the number of chunks or tokens read."""
+    if not ENABLED:
+        return
+    task = getattr(_CURRENT, 'task', None)
+    if task is not None:
+        task.counters[name] += value
+        return
+    with _LOCK:
+        _COUNTERS[name] += value
+    record = getattr(_CURRENT, 'record', None)
+    if record is not None:
+        record['counters'][name] = record['counters'].get(name, 0) + value
+
+
+def instrumented(name: str, is_request: bool = False):
+    """Decorator timing every call of the function as a stage, or as a request."""
+
+    def decorator(funct):
+        @wraps(funct)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return funct(*args, **kwargs)
+            with (request(name) if is_request else stage(name)):
+                return funct(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def run_task(funct, *args, **kwargs):
+    """
+    Runs a task sent to a worker. Outside of any request, as on a worker process or thread, the stages and counters
+    the task records are returned along with its result in a TaskResult, to be added to the request awaiting it by
+    task_result. Within a request, as with the dummy executor, they are recorded directly and the result returned.
+    """
+    if not ENABLED or getattr(_CURRENT, 'record', None) is not None or getattr(_CURRENT, 'task', None) is not None:
+        return funct(*args, **kwargs)
+    task = TaskResult()
+    _CURRENT.task = task
+    start = time.perf_counter()
+    try:
+        task.value = funct(*args, **kwargs)
+    finally:
+        _CURRENT.task = None
+    task.critical_seconds += time.perf_counter() - start
+    return task
+
+
+def task_result(result, submitted_at: Optional[float] = None):
+    """
+    Returns the value of a task's result, adding the stages and counters of a TaskResult to the current request,
+    or task, as if they had been recorded here.
+    :param submitted_at: time.perf_counter() when the task was submitted, the time since then outside of the task's
+                         critical path, spent scheduling, queueing and transferring, is recorded as 'scheduling'
+    """
+    if not isinstance(result, TaskResult):
+        return result
+    task = getattr(_CURRENT, 'task', None)
+    if task is not None:
+        task.stages.extend(result.stages)
+        for name, value in result.counters.items():
+            task.counters[name] += value
+        # The critical path of the task awaiting this result goes through its longest input
+        task.critical_seconds = max(task.critical_seconds, result.critical_seconds)
+        return result.value
+    for name, seconds in result.stages:
+        _add_stage(name, seconds)
+    for name, value in result.counters.items():
+        count(name, value)
+    if submitted_at is not None:
+        _add_stage('scheduling', max(0., time.perf_counter() - submitted_at - result.critical_seconds))
+    return result.value
+
+
+def task_value(result):
+    """Returns the value of a task's result without recording its stages, when task_result records them elsewhere."""
+    return result.value if isinstance(result, TaskResult) else result
+
+
+def snapshot() -> Dict[str, dict]:
+    """Returns the totals recorded by this process since it started or since reset."""
+    with _LOCK:
+        return {
+            'stages': {name: {'count': _STAGE_COUNTS[name], 'seconds': _STAGE_SECONDS[name],
+                              'max_seconds': _STAGE_MAX_SECONDS[name]} for name in _STAGE_COUNTS},
+            'counters': dict(_COUNTERS),
+        }
+
+
+def reset():
+    with _LOCK:
+        _STAGE_COUNTS.clear()
+        _STAGE_SECONDS.clear()
+        _STAGE_MAX_SECONDS.clear()
+        _COUNTERS.clear()
+
+
+def prometheus_text() -> str:
+    """Renders the process totals in the Prometheus text exposition format."""
+    totals = snapshot()
+    lines = ['# TYPE cape_responder_stage_seconds summary']
+    for name, stage_totals in sorted(totals['stages'].items()):
+        lines.append(f'cape_responder_stage_seconds_count{{stage="{name}"}} {stage_totals["count"]}')
+        lines.append(f'cape_responder_stage_seconds_sum{{stage="{name}"}} {stage_totals["seconds"]}')
+    lines.append('# TYPE cape_responder_stage_max_seconds gauge')
+    for name, stage_totals in sorted(totals['stages'].items()):
+        lines.append(f'cape_responder_stage_max_seconds{{stage="{name}"}} {stage_totals["max_seconds"]}')
+    lines.append('# TYPE cape_responder_total counter')
+    for name, value in sorted(totals['counters'].items()):
+        lines.append(f'cape_responder_total{{name="{name}"}} {value}')
+    return '\n'.join(lines) + '\n'
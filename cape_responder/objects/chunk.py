@@ -0,0 +1,45 @@
+# Copyright 2018 BLEMUNDSBURY AI LIMITED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from typing import Tuple
+
+
+class Chunk:
+    """Parsed copy of a SearchResult holding only what the workers and the reducer need."""
+    __slots__ = ('document_id', 'text', 'text_span', 'overlap_before', 'overlap_after', 'embedding')
+
+    def __init__(self, document_id: str, text: str, text_span: Tuple[int, int], overlap_before: str,
+                 overlap_after: str, embedding: str = ''):
+        self.document_id = document_id
+        self.text = text
+        self.text_span = text_span
+        self.overlap_before = overlap_before
+        self.overlap_after = overlap_after
+        self.embedding = embedding
+
+    def __reduce__(self):
+        # Positional arguments pickle smaller than the default per slot state, chunks are sent to workers in bulk
+        return Chunk, (self.document_id, self.text, self.text_span, self.overlap_before, self.overlap_after,
+                       self.embedding)
+
+    def for_reduce(self) -> 'Chunk':
+        """Copy without the overlaps and embedding, which only the workers reading the chunk need."""
+        return Chunk(self.document_id, self.text, self.text_span, '', '')
+
+    @staticmethod
+    def from_search_result(search_result) -> 'Chunk':
+        fields = search_result.get_indexable_string_fields()
+        return Chunk(fields['document_id'], search_result.matched_content, tuple(json.loads(fields['text_span'])),
+                     fields['overlap_before'], fields['overlap_after'], fields['embedding'])
@@ -12,25 +12,26 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from typing import List
+from typing import List, Optional
 
 
 class Response:
-    answer_text: str
-    answer_context: str
-    confidence: float
-    source_id: str
-    source_type: str
-    answer_text_start_offset: int
-    answer_text_end_offset: int
-    answer_context_start_offset: int
-    answer_context_end_offset: int
+    """
+    One answer of the responder. answer_text and answer_context can be given as slices of larger source texts,
+    they are only sliced when read, and to_dict converts the answer to the API format.
+    """
+    __slots__ = ('_answer_text', '_answer_text_slice', '_answer_context', '_answer_context_slice', 'confidence',
+                 'source_id', 'source_type', 'answer_text_start_offset', 'answer_text_end_offset',
+                 'answer_context_start_offset', 'answer_context_end_offset')
 
     def __init__(self, answer_text: str, answer_context: str, confidence: float, source_id: str, source_type: str,
                  answer_text_start_offset: int, answer_text_end_offset: int,
-                 answer_context_start_offset: int, answer_context_end_offset: int):
-        self.answer_text = answer_text
-        self.answer_context = answer_context
+                 answer_context_start_offset: int, answer_context_end_offset: int,
+                 answer_text_slice: Optional[slice] = None, answer_context_slice: Optional[slice] = None):
+        self._answer_text = answer_text
+        self._answer_text_slice = answer_text_slice
+        self._answer_context = answer_context
+        self._answer_context_slice = answer_context_slice
         self.confidence = confidence
         self.source_id = source_id
         self.source_type = source_type
@@ -39,6 +40,37 @@ class Response:
         self.answer_context_start_offset = answer_context_start_offset
         self.answer_context_end_offset = answer_context_end_offset
 
+    def __reduce__(self):
+        return Response, (self._answer_text, self._answer_context, self.confidence, self.source_id, self.source_type,
+                          self.answer_text_start_offset, self.answer_text_end_offset,
+                          self.answer_context_start_offset, self.answer_context_end_offset,
+                          self._answer_text_slice, self._answer_context_slice)
+
+    @property
+    def answer_text(self) -> str:
+        if self._answer_text_slice is None:
+            return self._answer_text
+        return self._answer_text[self._answer_text_slice]
+
+    @property
+    def answer_context(self) -> str:
+        if self._answer_context_slice is None:
+            return self._answer_context
+        return self._answer_context[self._answer_context_slice]
+
+    def to_dict(self) -> dict:
+        return {
+            "answerText": self.answer_text,
+            "answerContext": self.answer_context,
+            "confidence": self.confidence,
+            "sourceType": self.source_type,
+            "sourceId": self.source_id,
+            "answerTextStartOffset": self.answer_text_start_offset,
+            "answerTextEndOffset": self.answer_text_end_offset,
+            "answerContextStartOffset": self.answer_context_start_offset,
+            "answerContextEndOffset": self.answer_context_end_offset,
+        }
+
 
 class ResponderAnswer:
     responses: List[Response]
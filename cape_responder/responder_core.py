@@ -13,20 +13,38 @@
 # limitations under the License.
 
 from math import ceil
-from typing import List, Tuple, Dict, Optional
-import json
+from typing import List, Tuple, Optional, Iterator
+import asyncio
+import heapq
+import time
+from concurrent.futures import CancelledError
+from threading import Event, Lock
 import numpy as np
 from hashlib import sha256
 from functools import partial
-from bisect import bisect_right
-from cape_responder.responder_settings import NUM_WORKERS_PER_REQUEST
-from cape_document_manager.document_store import SearchResult, DocumentStore
+from itertools import chain
+from operator import attrgetter, itemgetter
+from cape_responder.responder_settings import NUM_WORKERS_PER_REQUEST, EMBEDDING_DTYPE, ANSWER_CACHE_SIZE, \
+    ANSWER_CACHE_TTL, MIN_TOKENS_PER_TASK, MAX_TASKS_PER_WORKER, WORKER_TOP_K, INLINE_CHUNK_WORDS, \
+    INLINE_OVERLAP_WORDS, INLINE_TEXT_CACHE_SIZE, DEADLINE_REDUCE_RESERVE_MS, RERANK_ENABLED, RERANK_SCORE_FLOOR, \
+    SAVED_REPLY_INDEX_ENABLED, SAVED_REPLY_INDEX_TOP_K, SAVED_REPLY_INDEX_USERS, SAVED_REPLY_INDEX_TTL, \
+    REQUEST_COALESCING, MAX_CONCURRENT_REQUESTS_PER_USER, MAX_PENDING_REQUESTS, ADMISSION_TIMEOUT_MS, \
+    WARM_UP_ON_IMPORT
+from cape_responder.caches import LRUCache, DocumentVersions, SingleFlight, normalise_question
+from cape_responder.embeddings import embedding_from_field, embedding_to_field
+from cape_responder.objects.chunk import Chunk
+from cape_responder.objects.responder_answer import Response
+from cape_responder.saved_reply_index import SavedReplyIndex
+from cape_responder.chunking import chunk_text, lexical_overlap_scores
+from cape_responder.instrumentation import instrumented, stage, count, run_task, task_result, task_value
+from cape_document_manager.document_store import DocumentStore
 from cape_document_manager.annotation_store import AnnotationStore
 from cape_machine_reader.cape_machine_reader_core import MachineReader, MachineReaderConfiguration
-from cape_document_qa import cape_docqa_machine_reader
 from cape_api_helpers.exceptions import UserException
 from cape_api_helpers.text_responses import ERROR_INVALID_THRESHOLD
-from cape_responder.task_manager import connect
+from cape_responder.task_manager import connect, connect_async, as_completed_batches, \
+    get_number_of_workers, get_number_of_workers_async, run_in_background, CancellationToken, cancel, wait_first, \
+    scatter, AdmissionControl, wait_for_workers, INTERACTIVE_PRIORITY, BULK_PRIORITY, EXECUTOR_BACKEND, IS_WORKER
 
 THRESHOLD_MAP = {
     'savedreply': {
@@ -46,23 +64,80 @@ THRESHOLD_MAP = {
 }
 
 SPEED_OR_ACCURACY_CHUNKS_MAP = {'speed': 0.25, 'balanced': 1, 'accuracy': 4, 'total': -1}
+# Share of the retrieved chunks kept by the re-ranking ahead of the machine reader, see RERANK_ENABLED
+SPEED_OR_ACCURACY_KEEP_RATIO_MAP = {'speed': 0.5, 'balanced': 0.75, 'accuracy': 1, 'total': 1}
 MACHINE_READER_MODEL_TYPE_TO_USE = 'CAPE_DOCUMENT_QA'
 
 
 class Responder:
     _MACHINE_READER = None  # MachineReader()
+    _MACHINE_READER_LOCK = Lock()
+    _READY = Event()
+    _ANSWERS = LRUCache(ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL)
+    _DOCUMENT_VERSIONS = DocumentVersions()
+    _INLINE_TEXT_CHUNKS = LRUCache(INLINE_TEXT_CACHE_SIZE)
+    _SAVED_REPLY_INDEXES = LRUCache(SAVED_REPLY_INDEX_USERS, ttl=SAVED_REPLY_INDEX_TTL)
+    _IN_FLIGHT = SingleFlight()
+    _ADMISSION = AdmissionControl(MAX_CONCURRENT_REQUESTS_PER_USER, MAX_PENDING_REQUESTS, ADMISSION_TIMEOUT_MS / 1000)
 
     @staticmethod
     def get_machine_reader():
         if Responder._MACHINE_READER is None:
-            if MACHINE_READER_MODEL_TYPE_TO_USE == 'CAPE_DOCUMENT_QA':
-                machine_reader_conf = cape_docqa_machine_reader.get_production_model_config()
-                machine_reader_model = cape_docqa_machine_reader.CapeDocQAMachineReaderModel(machine_reader_conf)
-            else:
-                raise ValueError('Machine reader model type {} not implemented'.format(MACHINE_READER_MODEL_TYPE_TO_USE))
-            Responder._MACHINE_READER = MachineReader(machine_reader_model)
+            # A background warm up and a request may both need the reader, it is only built once
+            with Responder._MACHINE_READER_LOCK:
+                if Responder._MACHINE_READER is None:
+                    if MACHINE_READER_MODEL_TYPE_TO_USE == 'CAPE_DOCUMENT_QA':
+                        # Imported here, loading the model's libraries takes seconds
+                        from cape_document_qa import cape_docqa_machine_reader
+                        machine_reader_conf = cape_docqa_machine_reader.get_production_model_config()
+                        machine_reader_model = cape_docqa_machine_reader.CapeDocQAMachineReaderModel(
+                            machine_reader_conf)
+                    else:
+                        raise ValueError('Machine reader model type {} not implemented'.format(
+                            MACHINE_READER_MODEL_TYPE_TO_USE))
+                    Responder._MACHINE_READER = MachineReader(machine_reader_model)
+                    if EXECUTOR_BACKEND == 'dummy':
+                        # This process reads the chunks itself, it is ready once its reader is loaded
+                        Responder._READY.set()
         return Responder._MACHINE_READER
 
+    @staticmethod
+    def warm_up_machine_reader():
+        """Loads the machine reader and runs one inference, so the first chunk read by this process is fast."""
+        with stage('warm_up'):
+            Responder.get_machine_reader().get_logits('This is a warm up.', 'What is this?', '', '')
+
+    @staticmethod
+    def warm_up():
+        """
+        Warms up the executor in use, so the first request served is fast. With the dummy executor this process reads
+        the chunks and loads the machine reader, otherwise it connects and waits until the workers have loaded theirs.
+        """
+        if EXECUTOR_BACKEND == 'dummy':
+            Responder.warm_up_machine_reader()
+        else:
+            with stage('warm_up'):
+                wait_for_workers(connect())
+        Responder._READY.set()
+
+    @staticmethod
+    def warm_up_in_background():
+        """Starts warm_up on a background thread and returns its future."""
+        return run_in_background(Responder.warm_up)
+
+    @staticmethod
+    def is_ready() -> bool:
+        """
+        Readiness probe: whether the executor in use can answer without a cold start, once warm_up has run or, with the
+        dummy executor, once this process has loaded the machine reader.
+        """
+        return Responder._READY.is_set()
+
+    @staticmethod
+    def wait_until_ready(timeout: Optional[float] = None) -> bool:
+        """Blocks until is_ready, or the timeout in seconds expires, and returns is_ready."""
+        return Responder._READY.wait(timeout)
+
     @staticmethod
     def split_chunks(l, number_of_workers):
         divided_chunks = []
@@ -70,6 +145,39 @@ class Responder:
             divided_chunks.append(l[i:i + number_of_workers])
         return divided_chunks
 
+    @staticmethod
+    def estimate_chunk_cost(chunk: Chunk) -> int:
+        """Rough number of tokens the machine reader will process for the chunk."""
+        return chunk.text.count(' ') + 1
+
+    @staticmethod
+    def partition_chunks(chunks: List[Chunk], number_of_workers: int,
+                         costs: Optional[List[int]] = None) -> List[List[Chunk]]:
+        """
+        Splits the chunks into slices of similar estimated cost, one per worker task.
+        The number of tasks follows the amount of work, bounded by MAX_TASKS_PER_WORKER times the available workers,
+        and each slice keeps the chunks in their original order.
+        """
+        if costs is None:
+            costs = [Responder.estimate_chunk_cost(chunk) for chunk in chunks]
+        number_of_tasks = min(len(chunks),
+                              max(1, number_of_workers * MAX_TASKS_PER_WORKER),
+                              max(1, int(ceil(sum(costs) / MIN_TOKENS_PER_TASK))))
+        if number_of_tasks == 0:
+            return []
+        count('chunks', len(chunks))
+        count('tokens', sum(costs))
+        count('worker_tasks', number_of_tasks)
+        # Longest processing time first: each chunk goes to the currently lightest slice
+        loads = [(0, task_idx) for task_idx in range(number_of_tasks)]
+        slices = [[] for _ in range(number_of_tasks)]
+        for chunk_idx in sorted(range(len(chunks)), key=costs.__getitem__, reverse=True):
+            load, task_idx = heapq.heappop(loads)
+            slices[task_idx].append(chunk_idx)
+            heapq.heappush(loads, (load + costs[chunk_idx], task_idx))
+        slices = sorted(sorted(indices) for indices in slices)
+        return [[chunks[chunk_idx] for chunk_idx in indices] for indices in slices]
+
     @staticmethod
     def get_machine_reader_configuration(offset=0, number_of_items=1, threshold='MEDIUM'):
         top_k = number_of_items + offset
@@ -80,6 +188,7 @@ class Responder:
         return MachineReaderConfiguration(threshold_reader=threshold_value, top_k=top_k)
 
     @staticmethod
+    @instrumented('get_answers_from_similar_questions', is_request=True)
     def get_answers_from_similar_questions(
             user_token: str,
             question: str,
@@ -96,13 +205,71 @@ class Responder:
         :param threshold:                           Only return results with the given confidence
         """
         type_to_param = {'all': None, 'saved_reply': True, 'annotation': False}
+        threshold_value = THRESHOLD_MAP['savedreply'][threshold]
+        if SAVED_REPLY_INDEX_ENABLED:
+            return Responder.get_saved_reply_index(user_token).search(question, threshold_value,
+                                                                      SAVED_REPLY_INDEX_TOP_K,
+                                                                      saved_replies=type_to_param[type],
+                                                                      document_ids=document_ids)
         results = AnnotationStore.similar_annotations(user_token, question, document_ids,
                                                       saved_replies=type_to_param[type])
-        threshold_value = THRESHOLD_MAP['savedreply'][threshold]
         results = list(filter(lambda reply: reply['confidence'] >= threshold_value, results))
         return results
 
     @staticmethod
+    def get_saved_reply_index(user_token: str) -> SavedReplyIndex:
+        """
+        Returns the user's saved reply index, built from the AnnotationStore on first use and rebuilt every
+        SAVED_REPLY_INDEX_TTL seconds to pick up annotations changed by other processes.
+        """
+
+        def build():
+            index = SavedReplyIndex()
+            for annotation in AnnotationStore.get_annotations(user_token):
+                index.add(annotation)
+            return index
+
+        return Responder._SAVED_REPLY_INDEXES.get_or_compute(user_token, build)
+
+    @staticmethod
+    def create_annotation(user_token: str, *args, **kwargs):
+        """AnnotationStore.create_annotation that keeps the user's saved reply index up to date."""
+        created = AnnotationStore.create_annotation(user_token, *args, **kwargs)
+        index = Responder._SAVED_REPLY_INDEXES.get(user_token)
+        if index is not None:
+            for annotation in AnnotationStore.get_annotations(user_token, annotation_ids=[created['annotationId']]):
+                index.add(annotation)
+        return created
+
+    @staticmethod
+    def delete_annotation(user_token: str, annotation_id: str):
+        """AnnotationStore.delete_annotation that keeps the user's saved reply index up to date."""
+        deleted = AnnotationStore.delete_annotation(user_token, annotation_id)
+        index = Responder._SAVED_REPLY_INDEXES.get(user_token)
+        if index is not None:
+            index.remove(annotation_id)
+        return deleted
+
+    @staticmethod
+    def invalidate_saved_replies(user_token: str):
+        """Rebuilds the user's saved reply index on next use, after changes made directly to the AnnotationStore."""
+        Responder._SAVED_REPLY_INDEXES.pop(user_token)
+
+    @staticmethod
+    async def get_answers_from_similar_questions_async(
+            user_token: str,
+            question: str,
+            type: str = 'all',
+            document_ids: List[str] = None,
+            threshold: str = 'MEDIUM'
+    ) -> List[dict]:
+        """Asyncio counterpart of get_answers_from_similar_questions, the annotation search runs in an executor."""
+        return await asyncio.get_event_loop().run_in_executor(
+            None, partial(Responder.get_answers_from_similar_questions, user_token, question, type=type,
+                          document_ids=document_ids, threshold=threshold))
+
+    @staticmethod
+    @instrumented('get_answers_from_documents', is_request=True)
     def get_answers_from_documents(
             user_token: str,
             question: str,
@@ -112,156 +279,693 @@ class Responder:
             text: str = None,
             threshold: str = 'MEDIUM',
             speed_or_accuracy: str = 'balanced',
+            cancellation: Optional[CancellationToken] = None,
+            time_budget_ms: Optional[int] = None,
     ) -> List[dict]:
         """
         Returns answers from a user's documents
 
+        :param user_token:      User's ID token
+        :param question:        Question in string format
+        :param document_ids:    Limit search to specified document IDs
+        :param text:            Search for an answer in the given text
+        :param cancellation:    Token another thread can use to cancel the request's worker tasks, a cancelled request
+                                raises CancelledError
+        :param time_budget_ms:  Answer from the chunks read within this time, best retrieved chunks first
+        """
+        deadline = time.monotonic() + time_budget_ms / 1000 if time_budget_ms is not None else None
+        # Requests that can be cut short by their caller do their own reading
+        coalesce = REQUEST_COALESCING and cancellation is None and deadline is None
+        cache_key = None
+        if ANSWER_CACHE_SIZE > 0 or coalesce:
+            cache_key = Responder.get_answer_cache_key(user_token, question,
+                                                       Responder.get_source_ids(document_ids, text), offset,
+                                                       number_of_items, threshold, speed_or_accuracy)
+        if ANSWER_CACHE_SIZE > 0:
+            cached_results = Responder._ANSWERS.get(cache_key)
+            if cached_results is not None:
+                return [response.to_dict() for response in cached_results]
+        read = partial(Responder.read_documents, user_token, question, document_ids, offset, number_of_items, text,
+                       threshold, speed_or_accuracy, cancellation, deadline)
+        if coalesce:
+            results = Responder._IN_FLIGHT.do(('documents',) + cache_key, read)
+        else:
+            results = read()
+
+        # Answers read within a time budget may be partial
+        if ANSWER_CACHE_SIZE > 0 and deadline is None:
+            Responder._ANSWERS.put(cache_key, results)
+
+        return [response.to_dict() for response in results]
+
+    @staticmethod
+    def read_documents(user_token: str, question: str, document_ids: Optional[List[str]], offset: int,
+                       number_of_items: int, text: Optional[str], threshold: str, speed_or_accuracy: str,
+                       cancellation: Optional[CancellationToken], deadline: Optional[float]) -> List[Response]:
+        """
+        Searches and reads the chunks answering the question for get_answers_from_documents, without caching.
+        Raises ResponderOverloadedException when the request is not admitted and CancelledError when it is cancelled.
+        """
+        with Responder._ADMISSION.admit(user_token):
+            limit_per_doc = Responder.get_limit_per_doc(number_of_items, speed_or_accuracy)
+            chunk_results = Responder.find_chunks(user_token, question, document_ids, text, limit_per_doc,
+                                                  speed_or_accuracy)
+            if len(chunk_results) == 0:
+                # We don't have any matching documents
+                return []
+            if cancellation is not None and cancellation.cancelled:
+                raise CancelledError()
+            priority = Responder.get_priority(speed_or_accuracy)
+            with stage('dispatch'):
+                submitted_at = time.perf_counter()
+                # The scattered chunks are kept referenced until the answers are gathered
+                if deadline is None:
+                    reduced_answers, future_answers, scattered_chunks = Responder.dispatch(
+                        connect(), question, chunk_results, offset, number_of_items, priority=priority)
+                else:
+                    reduced_answers, future_answers, scattered_chunks = Responder.dispatch_within_budget(
+                        connect(), question, chunk_results, offset, number_of_items, deadline, priority=priority,
+                        cancellation=cancellation)
+                    # Slices are started one after the other, so their critical path does not span the dispatch
+                    submitted_at = None
+                    if reduced_answers is None:
+                        if cancellation is not None and cancellation.cancelled:
+                            raise CancelledError()
+                        # No worker completed within the time budget
+                        return []
+                if cancellation is not None:
+                    # Cancelling the worker tasks too stops the reading of the slices not started yet
+                    cancellation.track(future_answers + [reduced_answers])
+                results = task_result(reduced_answers.result(), submitted_at)
+
+        return Responder.filter_by_threshold(results, threshold)
+
+    @staticmethod
+    def get_priority(speed_or_accuracy: str) -> int:
+        """Dask priority of a request's tasks, reading all the documents is bulk work."""
+        return BULK_PRIORITY if speed_or_accuracy == 'total' else INTERACTIVE_PRIORITY
+
+    @staticmethod
+    @instrumented('get_answers', is_request=True)
+    def get_answers(
+            user_token: str,
+            question: str,
+            document_ids: Optional[List[str]] = None,
+            offset: int = 0,
+            number_of_items: int = 1,
+            text: str = None,
+            threshold: str = 'MEDIUM',
+            speed_or_accuracy: str = 'balanced',
+            saved_reply_type: str = 'all',
+            early_exit: bool = True,
+            time_budget_ms: Optional[int] = None,
+    ) -> List[dict]:
+        """
+        Returns answers from saved replies, annotations and documents, sorted by confidence.
+        Documents are read in the background while similar questions are looked up.
+
+        :param user_token:          User's ID token
+        :param question:            Question in string format
+        :param document_ids:        Limit search to specified document IDs
+        :param text:                Search for an answer in the given text
+        :param saved_reply_type:    'saved_reply', 'annotation' or 'all'
+        :param early_exit:          Cancel the document search once a saved reply has a VERYHIGH confidence
+        :param time_budget_ms:      Time budget of the document search, see get_answers_from_documents
+        """
+        if REQUEST_COALESCING:
+            key = ('answers', saved_reply_type, early_exit, time_budget_ms) + Responder.get_answer_cache_key(
+                user_token, question, Responder.get_source_ids(document_ids, text), offset, number_of_items,
+                threshold, speed_or_accuracy)
+            return [dict(result) for result in Responder._IN_FLIGHT.do(key, partial(
+                Responder.combine_answers, user_token, question, document_ids, offset, number_of_items, text,
+                threshold, speed_or_accuracy, saved_reply_type, early_exit, time_budget_ms))]
+        return Responder.combine_answers(user_token, question, document_ids, offset, number_of_items, text,
+                                         threshold, speed_or_accuracy, saved_reply_type, early_exit, time_budget_ms)
+
+    @staticmethod
+    def combine_answers(user_token: str, question: str, document_ids: Optional[List[str]], offset: int,
+                        number_of_items: int, text: Optional[str], threshold: str, speed_or_accuracy: str,
+                        saved_reply_type: str, early_exit: bool, time_budget_ms: Optional[int]) -> List[dict]:
+        """Looks up similar questions while reading documents in the background, for get_answers."""
+        cancellation = CancellationToken()
+        document_answers = run_in_background(Responder.get_answers_from_documents, user_token, question,
+                                             document_ids=document_ids, offset=offset,
+                                             number_of_items=number_of_items, text=text, threshold=threshold,
+                                             speed_or_accuracy=speed_or_accuracy, cancellation=cancellation,
+                                             time_budget_ms=time_budget_ms)
+        results = Responder.get_answers_from_similar_questions(user_token, question, type=saved_reply_type,
+                                                               document_ids=document_ids, threshold=threshold)
+        if early_exit and any(reply['confidence'] >= THRESHOLD_MAP['savedreply']['VERYHIGH'] for reply in results):
+            cancellation.cancel()
+        else:
+            results = results + document_answers.result()
+        return sorted(results, key=itemgetter('confidence'), reverse=True)[:offset + number_of_items]
+
+    @staticmethod
+    async def get_answers_from_documents_async(
+            user_token: str,
+            question: str,
+            document_ids: Optional[List[str]] = None,
+            offset: int = 0,
+            number_of_items: int = 1,
+            text: str = None,
+            threshold: str = 'MEDIUM',
+            speed_or_accuracy: str = 'balanced',
+    ) -> List[dict]:
+        """
+        Asyncio counterpart of get_answers_from_documents, the event loop is never blocked while workers read.
+
         :param user_token:      User's ID token
         :param question:        Question in string format
         :param document_ids:    Limit search to specified document IDs
         :param text:            Search for an answer in the given text
         """
-        results = []
+        loop = asyncio.get_event_loop()
+        cache_key = None
+        if ANSWER_CACHE_SIZE > 0:
+            cache_key = Responder.get_answer_cache_key(user_token, question,
+                                                       Responder.get_source_ids(document_ids, text), offset,
+                                                       number_of_items, threshold, speed_or_accuracy)
+            cached_results = Responder._ANSWERS.get(cache_key)
+            if cached_results is not None:
+                return [response.to_dict() for response in cached_results]
+        # Waiting for a slot would block the event loop, requests over the tenant's limit are rejected instead
+        with Responder._ADMISSION.admit(user_token, timeout=0):
+            limit_per_doc = Responder.get_limit_per_doc(number_of_items, speed_or_accuracy)
+            chunk_results = await loop.run_in_executor(None, Responder.find_chunks, user_token, question,
+                                                       document_ids, text, limit_per_doc, speed_or_accuracy)
+            if len(chunk_results) == 0:
+                # We don't have any matching documents
+                return []
+            client = await connect_async()
+            number_of_workers = await get_number_of_workers_async(client)
+            # The scattered chunks are kept referenced until the answers are gathered
+            reduced_answers, _, scattered_chunks = Responder.dispatch(client, question, chunk_results, offset,
+                                                                      number_of_items,
+                                                                      number_of_workers=number_of_workers,
+                                                                      priority=Responder.get_priority(speed_or_accuracy))
+            results = task_result(await reduced_answers)
+
+        results = Responder.filter_by_threshold(results, threshold)
+        if cache_key is not None:
+            Responder._ANSWERS.put(cache_key, results)
+
+        return [response.to_dict() for response in results]
+
+    @staticmethod
+    def get_answers_from_documents_stream(
+            user_token: str,
+            question: str,
+            document_ids: Optional[List[str]] = None,
+            offset: int = 0,
+            number_of_items: int = 1,
+            text: str = None,
+            threshold: str = 'MEDIUM',
+            speed_or_accuracy: str = 'balanced',
+    ) -> Iterator[List[dict]]:
+        """
+        Yields provisional answers from a user's documents each time more workers complete. Workers return their own
+        top answers, which are merged into the running top answers, so the last list yielded is the one
+        get_answers_from_documents returns with WORKER_TOP_K.
+
+        :param user_token:      User's ID token
+        :param question:        Question in string format
+        :param document_ids:    Limit search to specified document IDs
+        :param text:            Search for an answer in the given text
+        """
+        with Responder._ADMISSION.admit(user_token):
+            limit_per_doc = Responder.get_limit_per_doc(number_of_items, speed_or_accuracy)
+            chunk_results = Responder.find_chunks(user_token, question, document_ids, text, limit_per_doc,
+                                                  speed_or_accuracy)
+            if len(chunk_results) == 0:
+                # We don't have any matching documents
+                return
+            client = connect()
+            worker_chunks = Responder.partition_chunks(chunk_results, get_number_of_workers(client))
+            machine_reader_configuration = Responder.get_machine_reader_configuration(offset, number_of_items)
+            scattered_chunks = scatter(client, worker_chunks)
+            future_answers = Responder.map_workers(client, question, scattered_chunks, machine_reader_configuration,
+                                                   priority=Responder.get_priority(speed_or_accuracy),
+                                                   top_answers=True)
+            top_answers = []
+            # Each worker's answers are only taken from its result once, so its stages are recorded once
+            worker_answers = {}
+            for futures in as_completed_batches(future_answers):
+                for future in futures:
+                    worker_answers[id(future)] = task_result(future.result())
+                if len(worker_answers) < len(future_answers):
+                    top_answers = Responder.merge_results([top_answers] + [worker_answers[id(future)]
+                                                                           for future in futures],
+                                                          machine_reader_configuration)
+                else:
+                    # Merge in dispatch order so ties break as in get_answers_from_documents
+                    top_answers = Responder.merge_results([worker_answers[id(future)] for future in future_answers],
+                                                          machine_reader_configuration)
+                yield [response.to_dict() for response in Responder.filter_by_threshold(top_answers, threshold)]
+
+    @staticmethod
+    @instrumented('get_answers_from_documents_batch', is_request=True)
+    def get_answers_from_documents_batch(
+            user_token: str,
+            questions: List[str],
+            document_ids: Optional[List[str]] = None,
+            offset: int = 0,
+            number_of_items: int = 1,
+            text: str = None,
+            threshold: str = 'MEDIUM',
+            speed_or_accuracy: str = 'balanced',
+    ) -> List[List[dict]]:
+        """
+        Returns answers from a user's documents for each of the questions, in the same order.
+        Chunks retrieved by several questions are read by a single worker task and all the questions are scheduled
+        together, instead of running get_answers_from_documents once per question.
+
+        :param user_token:      User's ID token
+        :param questions:       Questions in string format
+        :param document_ids:    Limit search to specified document IDs
+        :param text:            Search for an answer in the given text
+        """
+        with Responder._ADMISSION.admit(user_token):
+            limit_per_doc = Responder.get_limit_per_doc(number_of_items, speed_or_accuracy)
+            chunks = []
+            chunk_questions = []
+            chunk_indices = {}
+            for question_idx, question in enumerate(questions):
+                for chunk in Responder.find_chunks(user_token, question, document_ids, text, limit_per_doc,
+                                                   speed_or_accuracy):
+                    key = (chunk.document_id, chunk.text_span)
+                    if key not in chunk_indices:
+                        chunk_indices[key] = len(chunks)
+                        chunks.append(chunk)
+                        chunk_questions.append([])
+                    chunk_questions[chunk_indices[key]].append(question_idx)
+            if len(chunks) == 0:
+                # We don't have any matching documents
+                return [[] for _ in questions]
+            client = connect()
+            costs = [Responder.estimate_chunk_cost(chunk) * len(chunk_questions[chunk_idx])
+                     for chunk_idx, chunk in enumerate(chunks)]
+            worker_chunks = Responder.partition_chunks(chunks, get_number_of_workers(client), costs=costs)
+            worker_chunk_questions = [[chunk_questions[chunk_indices[(chunk.document_id, chunk.text_span)]]
+                                       for chunk in chunk_slice] for chunk_slice in worker_chunks]
+            scattered_tasks = scatter(client, list(zip(worker_chunks, worker_chunk_questions)))
+            future_logits = client.map(partial(run_task, Responder.machine_reader_logits_for_questions, questions),
+                                       scattered_tasks, priority=BULK_PRIORITY)
+            worker_chunks = Responder.chunks_for_reduce(worker_chunks)
+            machine_reader_configuration = Responder.get_machine_reader_configuration(offset, number_of_items)
+            future_answers = []
+            for question_idx in range(len(questions)):
+                question_chunks = [[chunk for chunk, question_indices in zip(chunk_slice, slice_questions)
+                                    if question_idx in question_indices]
+                                   for chunk_slice, slice_questions in zip(worker_chunks, worker_chunk_questions)]
+                if not any(question_chunks):
+                    future_answers.append(None)
+                    continue
+                # The workers' stages are recorded by the first reduce only
+                future_answers.append(client.submit(partial(run_task, Responder.reduce_question_results),
+                                                    future_logits, question_idx, machine_reader_configuration,
+                                                    question_chunks, all(future is None for future in future_answers),
+                                                    priority=BULK_PRIORITY))
+            return [[response.to_dict() for response in Responder.filter_by_threshold(task_result(future.result()),
+                                                                                      threshold)]
+                    if future is not None else [] for future in future_answers]
+
+    @staticmethod
+    def get_inline_document_id(text: str) -> str:
+        return 'Inline text-' + sha256(text.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def get_source_ids(document_ids: Optional[List[str]], text: Optional[str]) -> Optional[List[str]]:
+        """IDs of the documents answers can come from, including the inline text, None meaning all documents."""
+        if text is None:
+            return document_ids
+        return (document_ids or []) + [Responder.get_inline_document_id(text)]
+
+    @staticmethod
+    def get_inline_text_chunks(text: str) -> List[Chunk]:
+        """Chunks of an inline text, cached by content hash so repeated pastes are only chunked once."""
+        document_id = Responder.get_inline_document_id(text)
+        return Responder._INLINE_TEXT_CHUNKS.get_or_compute(
+            document_id, partial(chunk_text, document_id, text, INLINE_CHUNK_WORDS, INLINE_OVERLAP_WORDS))
+
+    @staticmethod
+    @instrumented('search')
+    def find_chunks(user_token: str, question: str, document_ids: Optional[List[str]], text: Optional[str],
+                    limit_per_doc: Optional[int], speed_or_accuracy: str = 'balanced') -> List[Chunk]:
+        """
+        Returns the chunks of the user's documents and of the inline text matching the question.
+        Inline text is chunked and ranked in memory, without a round trip to the DocumentStore.
+        With RERANK_ENABLED only the chunks kept by rerank_chunks are returned.
+        """
+        chunks = []
+        if text is None or document_ids:
+            chunks.extend(Responder.search_chunks(user_token, question, document_ids, limit_per_doc))
         if text is not None:
-            temp_id = 'Inline text-' + sha256(text.encode('utf-8')).hexdigest()
-            DocumentStore.create_document(user_token, "Inline text", "Inline text", text,
-                                          document_id=temp_id, replace=True)
-            if document_ids is not None:
-                document_ids.append(temp_id)
-            else:
-                document_ids = [temp_id]
+            inline_chunks = Responder.get_inline_text_chunks(text)
+            scores = lexical_overlap_scores(question, [chunk.text for chunk in inline_chunks])
+            ranking = sorted(range(len(inline_chunks)), key=lambda chunk_idx: -scores[chunk_idx])
+            chunks.extend(inline_chunks[chunk_idx] for chunk_idx in ranking[:limit_per_doc])
+        if RERANK_ENABLED:
+            chunks = Responder.rerank_chunks(question, chunks, SPEED_OR_ACCURACY_KEEP_RATIO_MAP[speed_or_accuracy])
+        return chunks
+
+    @staticmethod
+    @instrumented('rerank')
+    def rerank_chunks(question: str, chunks: List[Chunk], keep_ratio: float,
+                      score_floor: float = RERANK_SCORE_FLOOR) -> List[Chunk]:
+        """
+        Cheap second stage ranking dropping the chunks least likely to hold an answer before they are read.
+        Keeps the keep_ratio share of the chunks with the highest lexical overlap with the question, among those
+        scoring at least score_floor, and always the best one. Kept chunks stay in retrieval order.
+        """
+        if not chunks or keep_ratio >= 1 and score_floor <= 0:
+            return chunks
+        scores = np.asarray(lexical_overlap_scores(question, [chunk.text for chunk in chunks]), dtype=np.float64)
+        number_to_keep = max(1, int(ceil(len(chunks) * keep_ratio)))
+        # Stable sort, chunks scoring the same keep the order of the retrieval
+        ranking = np.argsort(-scores, kind='stable')[:number_to_keep]
+        ranking = ranking[(scores[ranking] >= score_floor) | (ranking == ranking[0])]
+        count('pruned_chunks', len(chunks) - len(ranking))
+        return [chunks[chunk_idx] for chunk_idx in np.sort(ranking).tolist()]
+
+    @staticmethod
+    def get_limit_per_doc(number_of_items: int, speed_or_accuracy: str) -> Optional[int]:
         speed_or_accuracy_coef = SPEED_OR_ACCURACY_CHUNKS_MAP[speed_or_accuracy]
         if speed_or_accuracy_coef > 0:
-            limit_per_doc = int(ceil(number_of_items * NUM_WORKERS_PER_REQUEST * speed_or_accuracy_coef))
-        else:
-            limit_per_doc = None
-        chunk_results = list(DocumentStore.search_chunks(user_token, question, document_ids=document_ids,
-                                                         limit_per_doc=limit_per_doc))
-        if len(chunk_results) == 0:
-            # We don't have any matching documents
-            return []
-        worker_chunks = Responder.split_chunks(chunk_results, NUM_WORKERS_PER_REQUEST)
-        respond = partial(Responder.machine_reader_logits, question)
-        future_answers: List = connect().map(respond, worker_chunks)
+            return int(ceil(number_of_items * NUM_WORKERS_PER_REQUEST * speed_or_accuracy_coef))
+        return None
+
+    @staticmethod
+    def search_chunks(user_token: str, question: str, document_ids: Optional[List[str]],
+                      limit_per_doc: Optional[int]) -> List[Chunk]:
+        """Returns the chunks matching the question, their fields are parsed once here for the whole pipeline."""
+        return [Chunk.from_search_result(search_result) for search_result in
+                DocumentStore.search_chunks(user_token, question, document_ids=document_ids,
+                                            limit_per_doc=limit_per_doc)]
+
+    @staticmethod
+    def dispatch(client, question: str, chunk_results: List[Chunk], offset: int, number_of_items: int,
+                 number_of_workers: Optional[int] = None, priority: int = INTERACTIVE_PRIORITY):
+        """
+        Sends the chunks to the workers and returns the future of the reduced answers, the futures of the worker
+        tasks it reduces and the scattered chunks the caller keeps until the answers are gathered.
+        Works with blocking as well as asynchronous clients since both share the submit/map surface.
+        """
+        if number_of_workers is None:
+            number_of_workers = get_number_of_workers(client)
+        worker_chunks = Responder.partition_chunks(chunk_results, number_of_workers)
         machine_reader_configuration = Responder.get_machine_reader_configuration(offset, number_of_items)
-        reduced_answers = connect().submit(Responder.reduce_results, future_answers,
-                                           machine_reader_configuration,
-                                           worker_chunks)
-        results.extend(reduced_answers.result())
-        if text is not None:
-            DocumentStore.delete_document(user_token, temp_id)
+        scattered_chunks = scatter(client, worker_chunks)
+        future_answers = Responder.map_workers(client, question, scattered_chunks, machine_reader_configuration,
+                                               priority=priority)
+        return Responder.submit_reduce(client, future_answers, machine_reader_configuration, worker_chunks,
+                                       priority=priority), future_answers, scattered_chunks
 
+    @staticmethod
+    def dispatch_within_budget(client, question: str, chunk_results: List[Chunk], offset: int, number_of_items: int,
+                               deadline: float, priority: int = INTERACTIVE_PRIORITY,
+                               cancellation: Optional[CancellationToken] = None):
+        """
+        Sends slices of chunks to the workers in retrieval order, one per available worker at a time, until the
+        deadline (in time.monotonic seconds) minus DEADLINE_REDUCE_RESERVE_MS is near or the cancellation is
+        cancelled. Outstanding tasks are then cancelled and the future of the answers reduced from the completed
+        slices is returned, None if none completed, along with the futures of the completed worker tasks and the
+        scattered chunks the caller keeps until the answers are gathered.
+        """
+        number_of_workers = get_number_of_workers(client)
+        # Small slices of about MIN_TOKENS_PER_TASK tokens, so that the budget is spent on the best chunks first
+        costs = [Responder.estimate_chunk_cost(chunk) for chunk in chunk_results]
+        number_of_tasks = min(len(chunk_results), max(1, int(ceil(sum(costs) / MIN_TOKENS_PER_TASK))))
+        worker_chunks = Responder.split_chunks(chunk_results, int(ceil(len(chunk_results) / number_of_tasks)))
+        count('chunks', len(chunk_results))
+        count('tokens', sum(costs))
+        machine_reader_configuration = Responder.get_machine_reader_configuration(offset, number_of_items)
+        reduce_deadline = deadline - DEADLINE_REDUCE_RESERVE_MS / 1000
+        scattered_chunks = []
+        pending = {}
+        completed = {}
+        task_seconds = 0.
+        next_slice = 0
+        while True:
+            now = time.monotonic()
+            # Only start a slice when the slowest one so far would still complete in time
+            while next_slice < len(worker_chunks) and len(pending) < number_of_workers and \
+                    now + task_seconds < reduce_deadline and (cancellation is None or not cancellation.cancelled):
+                scattered_chunks.extend(scatter(client, [worker_chunks[next_slice]]))
+                future = Responder.map_workers(client, question, scattered_chunks[-1:],
+                                               machine_reader_configuration, priority=priority)[0]
+                if cancellation is not None:
+                    cancellation.track([future])
+                pending[id(future)] = (next_slice, future, now)
+                next_slice += 1
+            if not pending:
+                break
+            done, _ = wait_first([future for _, future, _ in pending.values()],
+                                 timeout=max(reduce_deadline - time.monotonic(), 0))
+            if not done:
+                break
+            for future in done:
+                slice_idx, _, started = pending.pop(id(future))
+                completed[slice_idx] = future
+                task_seconds = max(task_seconds, time.monotonic() - started)
+        cancel([future for _, future, _ in pending.values()])
+        count('worker_tasks', next_slice)
+        count('skipped_chunks', sum(len(worker_chunks[slice_idx]) for slice_idx in range(len(worker_chunks))
+                                    if slice_idx not in completed))
+        if not completed:
+            return None, [], scattered_chunks
+        indices = sorted(completed)
+        future_answers = [completed[idx] for idx in indices]
+        return Responder.submit_reduce(client, future_answers, machine_reader_configuration,
+                                       [worker_chunks[idx] for idx in indices], priority=priority), \
+            future_answers, scattered_chunks
+
+    @staticmethod
+    def map_workers(client, question: str, scattered_chunks: List,
+                    machine_reader_configuration: MachineReaderConfiguration,
+                    priority: int = INTERACTIVE_PRIORITY, top_answers: Optional[bool] = None) -> List:
+        """
+        Starts one worker task per slice returned by scatter, returning their logits or, with top_answers, their top
+        answers. top_answers defaults to WORKER_TOP_K.
+        """
+        if top_answers is None:
+            top_answers = WORKER_TOP_K
+        if top_answers:
+            respond = partial(Responder.machine_reader_top_answers, question, machine_reader_configuration)
+        else:
+            respond = partial(Responder.machine_reader_logits, question)
+        return client.map(partial(run_task, respond), scattered_chunks, priority=priority)
+
+    @staticmethod
+    def submit_reduce(client, future_answers: List, machine_reader_configuration: MachineReaderConfiguration,
+                      worker_chunks: List[List[Chunk]], priority: int = INTERACTIVE_PRIORITY):
+        """
+        Returns the future of the answers reduced from the given worker tasks.
+        Only the chunks' positions are sent along, so the reduce runs where most of the logits already are.
+        """
+        if WORKER_TOP_K:
+            return client.submit(partial(run_task, Responder.merge_results), future_answers,
+                                 machine_reader_configuration, priority=priority)
+        return client.submit(partial(run_task, Responder.reduce_results), future_answers, machine_reader_configuration,
+                             Responder.chunks_for_reduce(worker_chunks), priority=priority)
+
+    @staticmethod
+    def chunks_for_reduce(worker_chunks: List[List[Chunk]]) -> List[List[Chunk]]:
+        return [[chunk.for_reduce() for chunk in chunk_slice] for chunk_slice in worker_chunks]
+
+    @staticmethod
+    def filter_by_threshold(results: List[Response], threshold: str) -> List[Response]:
         threshold_value = THRESHOLD_MAP['document'].get(threshold, THRESHOLD_MAP['document']['MEDIUM'])
+        return [response for response in results if response.confidence >= threshold_value]
 
-        results = list(filter(lambda reply: reply['confidence'] >= threshold_value, results))
+    @staticmethod
+    def get_answer_cache_key(user_token: str, question: str, document_ids: Optional[List[str]], offset: int,
+                             number_of_items: int, threshold: str, speed_or_accuracy: str) -> Tuple:
+        """Key of the answers cache, it includes the current version of every document the answers can come from."""
+        return (user_token, normalise_question(question), Responder._DOCUMENT_VERSIONS.key(user_token, document_ids),
+                offset, number_of_items, threshold, speed_or_accuracy)
 
-        return results
+    @staticmethod
+    def invalidate_documents(user_token: str, document_ids: List[str]):
+        """Drop cached answers sourced from the given documents, or from all the user's documents."""
+        Responder._DOCUMENT_VERSIONS.bump(user_token, document_ids)
 
     @staticmethod
+    def create_document(user_token: str, title: str, origin: str, text: str, document_id: Optional[str] = None,
+                        *args, **kwargs):
+        """DocumentStore.create_document that keeps the answers cache consistent."""
+        created = DocumentStore.create_document(user_token, title, origin, text, document_id, *args, **kwargs)
+        Responder.invalidate_documents(user_token, [document_id] if document_id else [])
+        return created
+
+    @staticmethod
+    def delete_document(user_token: str, document_id: str):
+        """DocumentStore.delete_document that keeps the answers cache consistent."""
+        deleted = DocumentStore.delete_document(user_token, document_id)
+        Responder.invalidate_documents(user_token, [document_id])
+        return deleted
+
+    @staticmethod
+    @instrumented('worker_task')
     def machine_reader_logits(
             question: str,
-            results: List[SearchResult]
+            results: List[Chunk]
     ) -> List[Tuple[Tuple[np.array, np.array], Tuple[int, int]]]:
         """
         Returns answers for the question sourced from the given range.
         :param user_token: User's token to identify document embedding cache to use
         :param question: question in string format
-        :param results: List of SearchResults to process by this worker
+        :param results: List of Chunks to process by this worker
         """
+        return Responder.read_chunks(question, results, Responder.parse_embeddings(results))
+
+    @staticmethod
+    @instrumented('parse_embeddings')
+    def parse_embeddings(results: List[Chunk]) -> List[Optional[np.array]]:
+        return [embedding_from_field(result.embedding) if len(result.embedding) > 0 else None for result in results]
+
+    @staticmethod
+    @instrumented('read')
+    def read_chunks(
+            question: str,
+            results: List[Chunk],
+            embeddings: List[Optional[np.array]]
+    ) -> List[Tuple[Tuple[np.array, np.array], Tuple[int, int]]]:
+        """Runs the chunks, whose embeddings are already parsed, through the machine reader."""
+        machine_reader = Responder.get_machine_reader()
+        return [machine_reader.get_logits(result.text, question, result.overlap_before, result.overlap_after,
+                                          document_embedding=embedding)
+                for result, embedding in zip(results, embeddings)]
+
+    @staticmethod
+    @instrumented('worker_task')
+    def machine_reader_logits_for_questions(
+            questions: List[str],
+            task: Tuple[List[Chunk], List[List[int]]]
+    ) -> List[List[Tuple[Tuple[np.array, np.array], Tuple[int, int]]]]:
+        """
+        Returns, for each question, the logits of the chunks of this worker's range it retrieved, in range order.
+        Embeddings are parsed once for all the questions.
+        :param questions: questions in string format
+        :param task: the Chunks to process by this worker and, for each chunk, the indices of its questions
+        """
+        results, chunk_questions = task
+        embeddings = Responder.parse_embeddings(results)
         logits = []
-        for result in results:
-            fields = result.get_indexable_string_fields()
-            embedding = None
-            if len(fields['embedding']) > 0:
-                embedding = np.asarray(json.loads(fields['embedding']))
-            logits.append(
-                Responder.get_machine_reader().get_logits(
-                    result.matched_content, question, fields['overlap_before'],
-                    fields['overlap_after'], document_embedding=embedding)
-            )
+        for question_idx, question in enumerate(questions):
+            indices = [chunk_idx for chunk_idx, question_indices in enumerate(chunk_questions)
+                       if question_idx in question_indices]
+            logits.append(Responder.read_chunks(question, [results[chunk_idx] for chunk_idx in indices],
+                                                [embeddings[chunk_idx] for chunk_idx in indices]))
         return logits
 
     @staticmethod
-    def combine_chunks(future_answers, chunks: List[SearchResult]):
+    def reduce_question_results(worker_logits, question_idx: int,
+                                machine_reader_configuration: MachineReaderConfiguration,
+                                chunks: List[List[Chunk]], record_workers: bool = True) -> List[Response]:
+        """
+        reduce_results for one of the questions answered by machine_reader_logits_for_questions.
+        :param record_workers: whether to record the stages of the worker tasks, shared by the questions' reduces
+        """
+        unwrap = task_result if record_workers else task_value
+        return Responder.reduce_results([unwrap(logits)[question_idx] for logits in worker_logits],
+                                        machine_reader_configuration, chunks)
+
+    @staticmethod
+    def combine_chunks(future_answers, chunks: List[List[Chunk]]):
         flat_logits = []
         flat_overlaps = []
-        flat_text = ""
-        positions = {}
+        texts = []
+        document_ids = []
+        text_spans = []
         for chunk_idx, answers in enumerate(future_answers):
             for group_idx, answer in enumerate(answers):
-                search_result = chunks[chunk_idx][group_idx]
+                chunk = chunks[chunk_idx][group_idx]
                 flat_logits.append(answer[0])
                 flat_overlaps.append(answer[1])
-                fields = search_result.get_indexable_string_fields()
-                # position in flat_text corresponds to position in doc_id starting at text_span[0]
-                positions[len(flat_text)] = (fields['document_id'],) + tuple(json.loads(fields['text_span']))
-                flat_text += " " + search_result.matched_content
+                texts.append(chunk.text)
+                document_ids.append(chunk.document_id)
+                text_spans.append(chunk.text_span)
+        # Every chunk is preceded by a space in flat_text
+        flat_text = ''.join(' ' + text for text in texts)
+        lengths = np.fromiter((len(text) + 1 for text in texts), dtype=np.int64, count=len(texts))
+        offsets = np.zeros(len(texts), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=offsets[1:])
+        # position offsets[i] in flat_text corresponds to position text_spans[i][0] in document_ids[i]
+        positions = (offsets, document_ids, np.asarray(text_spans, dtype=np.int64).reshape(-1, 2))
         return flat_logits, flat_overlaps, flat_text, positions
 
     @staticmethod
+    @instrumented('translate_spans')
     def translate_spans(answer_spans: List[Tuple[int, int]], context_spans: List[Tuple[int, int]],
-                        positions: Dict[int, Tuple[str, int, int]]) -> List[
-        Tuple[str, int, int]]:
+                        positions: Tuple[np.array, List[str], np.array]) -> List[
+        Tuple[str, int, int, int, int, int, int]]:
         """Take spans from combined chunks and return the original document id and span"""
-        offsets, references = list(zip(*sorted(positions.items())))
-        results = []
-        for answer_idx, span in enumerate(answer_spans):
-            context_span = context_spans[answer_idx]
-            idx = bisect_right(offsets, span[0]) - 1
-            doc_id, doc_beg, doc_end = references[idx]
-            # We do -1 because we add a space when combining
-            new_span_beg = doc_beg + (span[0] - offsets[idx] - 1)
-            full_context_span_beg = doc_beg + (context_span[0] - offsets[idx] - 1)
-            new_context_span_beg = max(full_context_span_beg, doc_beg)
-            new_span_end = min(doc_beg + (span[1] - offsets[idx] - 1), doc_end)
-            full_context_span_end = doc_beg + (context_span[1] - offsets[idx] - 1)
-            new_context_span_end = min(full_context_span_end, doc_end)
-            results.append((doc_id, new_span_beg, new_span_end,
-                            new_context_span_beg, new_context_span_end,
+        if len(answer_spans) == 0:
+            return []
+        offsets, document_ids, text_spans = positions
+        answer_spans = np.asarray(answer_spans, dtype=np.int64).reshape(-1, 2)
+        context_spans = np.asarray(context_spans, dtype=np.int64).reshape(-1, 2)
+        idx = np.searchsorted(offsets, answer_spans[:, 0], side='right') - 1
+        # We do +1 because we add a space when combining
+        chunk_starts = offsets[idx] + 1
+        doc_beg = text_spans[idx, 0]
+        doc_end = text_spans[idx, 1]
+        new_span_beg = doc_beg + (answer_spans[:, 0] - chunk_starts)
+        full_context_span_beg = doc_beg + (context_spans[:, 0] - chunk_starts)
+        new_context_span_beg = np.maximum(full_context_span_beg, doc_beg)
+        new_span_end = np.minimum(doc_beg + (answer_spans[:, 1] - chunk_starts), doc_end)
+        full_context_span_end = doc_beg + (context_spans[:, 1] - chunk_starts)
+        new_context_span_end = np.minimum(full_context_span_end, doc_end)
+        columns = np.stack([new_span_beg, new_span_end, new_context_span_beg, new_context_span_end,
                             new_context_span_beg - full_context_span_beg,
-                            full_context_span_end - new_context_span_end
-                            ))
-        return results
+                            full_context_span_end - new_context_span_end], axis=1).tolist()
+        return [(document_ids[chunk_idx],) + tuple(row) for chunk_idx, row in zip(idx.tolist(), columns)]
 
     @staticmethod
+    @instrumented('reduce')
     def reduce_results(future_answers, machine_reader_configuration: MachineReaderConfiguration,
-                       chunks: List[SearchResult]) -> List[dict]:
+                       chunks: List[List[Chunk]]) -> List[Response]:
+        future_answers = [task_result(answers) for answers in future_answers]
         flat_logits, flat_overlaps, flat_text, positions = Responder.combine_chunks(future_answers, chunks)
-        results = []
-        answer_spans = []
-        answer_context_spans = []
-        for answer in Responder.get_machine_reader().get_answers_from_logits(machine_reader_configuration, flat_logits,
-                                                                             flat_overlaps, flat_text):
-            results.append({
-                "answerText": answer.text,
-                "answerContext": answer.long_text,
-                "confidence": float(answer.score_reader),
-                "sourceType": 'document',
-                "sourceId": None,
-                "answerTextStartOffset": None,
-                "answerTextEndOffset": None,
-                "answerContextStartOffset": None,
-                "answerContextEndOffset": None
-            })
-            # TODO long text spans
-            answer_spans.append(answer.span)
-            answer_context_spans.append(answer.long_text_span)
-        for (idx, (doc_id, answer_beg_span, answer_end_span,
-                   context_beg_span, context_end_span,
-                   context_diff_beg, context_diff_end)) in enumerate(
-            Responder.translate_spans(answer_spans, answer_context_spans, positions)):
-            results[idx]["sourceId"] = doc_id
-            results[idx]["answerTextStartOffset"] = answer_beg_span
-            results[idx]["answerTextEndOffset"] = answer_end_span
-            results[idx]["answerContextStartOffset"] = context_beg_span
-            results[idx]["answerContextEndOffset"] = context_end_span
-            answer_range = answer_end_span - answer_beg_span
-            results[idx]["answerText"] = results[idx]["answerText"][:answer_range]
-            results[idx]["answerContext"] = results[idx]["answerContext"][
-                                            context_diff_beg:(-context_diff_end) if context_diff_end else None]
-            # debug("----Translating answer text spans took", time.time() - tic)
-        return results
+        answers = list(Responder.get_machine_reader().get_answers_from_logits(machine_reader_configuration,
+                                                                              flat_logits, flat_overlaps, flat_text))
+        # TODO long text spans
+        spans = Responder.translate_spans([answer.span for answer in answers],
+                                          [answer.long_text_span for answer in answers], positions)
+        return [Response(answer.text, answer.long_text, float(answer.score_reader), doc_id, 'document',
+                         answer_beg_span, answer_end_span, context_beg_span, context_end_span,
+                         answer_text_slice=slice(answer_end_span - answer_beg_span),
+                         answer_context_slice=slice(context_diff_beg, -context_diff_end if context_diff_end else None))
+                for answer, (doc_id, answer_beg_span, answer_end_span, context_beg_span, context_end_span,
+                             context_diff_beg, context_diff_end) in zip(answers, spans)]
+
+    @staticmethod
+    def machine_reader_top_answers(question: str, machine_reader_configuration: MachineReaderConfiguration,
+                                   results: List[Chunk]) -> List[Response]:
+        """
+        Returns the top answers for the question within the given range, translated to document offsets,
+        so only top_k candidates per worker are sent back to the reducer.
+        :param question: question in string format
+        :param machine_reader_configuration: configuration holding the top_k and reader threshold
+        :param results: List of Chunks to process by this worker
+        """
+        logits = Responder.machine_reader_logits(question, results)
+        return Responder.reduce_results([logits], machine_reader_configuration, [results])
+
+    @staticmethod
+    def merge_results(worker_answers: List[List[Response]],
+                      machine_reader_configuration: MachineReaderConfiguration) -> List[Response]:
+        """Merges the workers' top answers keeping the top_k most confident, ties keep the dispatch order."""
+        return heapq.nlargest(machine_reader_configuration.top_k,
+                              chain.from_iterable(task_result(answers) for answers in worker_answers),
+                              key=attrgetter('confidence'))
 
     @staticmethod
     def get_document_embeddings(text):
-        return json.dumps(Responder.get_machine_reader().get_document_embedding(text).tolist())
+        return embedding_to_field(Responder.get_machine_reader().get_document_embedding(text), EMBEDDING_DTYPE)
+
+
+# Worker processes load their machine reader through initialize_worker instead
+if WARM_UP_ON_IMPORT and not IS_WORKER:
+    Responder.warm_up_in_background()
@@ -23,3 +23,42 @@ def envint(varname: str, default: int) -> int:
 CLUSTER_SCHEDULER_IP = os.getenv("CAPE_CLUSTER_SCHEDULER_IP", "127.0.0.1")
 CLUSTER_SCHEDULER_PORT = envint("CAPE_CLUSTER_SCHEDULER_PORT", 8786)
 NUM_WORKERS_PER_REQUEST = envint("CAPE_NUM_WORKERS_PER_REQUEST", 8)
+# Precision of the document embeddings stored at ingest time: float16, float32 or int8 (quantised per vector)
+EMBEDDING_DTYPE = os.getenv("CAPE_EMBEDDING_DTYPE", "float32")
+# Answers cache for get_answers_from_documents, disabled when the size is 0
+ANSWER_CACHE_SIZE = envint("CAPE_ANSWER_CACHE_SIZE", 0)
+ANSWER_CACHE_TTL = envint("CAPE_ANSWER_CACHE_TTL", 300)
+LOCAL_CLUSTER_WORKERS = envint("CAPE_LOCAL_CLUSTER_WORKERS", os.cpu_count() or 1)
+# Worker tasks are sized to hold at least this many estimated tokens, with at most this many tasks per worker core
+MIN_TOKENS_PER_TASK = envint("CAPE_MIN_TOKENS_PER_TASK", 2000)
+MAX_TASKS_PER_WORKER = envint("CAPE_MAX_TASKS_PER_WORKER", 2)
+# Workers return their own top answers, merged by the reducer, instead of shipping the logits of every chunk
+WORKER_TOP_K = os.getenv("CAPE_WORKER_TOP_K", "false").lower() == "true"
+# Chunking of the text passed inline to get_answers_from_documents
+INLINE_CHUNK_WORDS = envint("CAPE_INLINE_CHUNK_WORDS", 300)
+INLINE_OVERLAP_WORDS = envint("CAPE_INLINE_OVERLAP_WORDS", 20)
+INLINE_TEXT_CACHE_SIZE = envint("CAPE_INLINE_TEXT_CACHE_SIZE", 128)
+# Per stage timers and counters, see cape_responder.instrumentation
+INSTRUMENTATION_ENABLED = os.getenv("CAPE_INSTRUMENTATION", "false").lower() == "true"
+# Time kept aside for the reduce step when answering within a time budget
+DEADLINE_REDUCE_RESERVE_MS = envint("CAPE_DEADLINE_REDUCE_RESERVE_MS", 50)
+# Drop the retrieved chunks with the least lexical overlap with the question before they reach the machine reader,
+# keeping the share of SPEED_OR_ACCURACY_KEEP_RATIO_MAP and only those whose overlap is at least the floor
+RERANK_ENABLED = os.getenv("CAPE_RERANK", "false").lower() == "true"
+RERANK_SCORE_FLOOR = float(os.getenv("CAPE_RERANK_SCORE_FLOOR", 0.0))
+# Answer saved replies from a per user in memory index instead of AnnotationStore.similar_annotations, the index is
+# kept up to date by Responder.create_annotation and Responder.delete_annotation, and rebuilt after the TTL in seconds
+# to pick up changes made by other processes
+SAVED_REPLY_INDEX_ENABLED = os.getenv("CAPE_SAVED_REPLY_INDEX", "false").lower() == "true"
+SAVED_REPLY_INDEX_TOP_K = envint("CAPE_SAVED_REPLY_INDEX_TOP_K", 10)
+SAVED_REPLY_INDEX_USERS = envint("CAPE_SAVED_REPLY_INDEX_USERS", 256)
+SAVED_REPLY_INDEX_TTL = envint("CAPE_SAVED_REPLY_INDEX_TTL", 60)
+# Identical requests arriving while one is in flight wait for its answers instead of searching and reading again
+REQUEST_COALESCING = os.getenv("CAPE_REQUEST_COALESCING", "true").lower() == "true"
+# Admission control: requests each user runs concurrently, the others wait for up to the timeout, and requests
+# running or waiting in this process beyond which new ones are rejected as overloaded. 0 means unlimited.
+MAX_CONCURRENT_REQUESTS_PER_USER = envint("CAPE_MAX_CONCURRENT_REQUESTS_PER_USER", 0)
+MAX_PENDING_REQUESTS = envint("CAPE_MAX_PENDING_REQUESTS", 0)
+ADMISSION_TIMEOUT_MS = envint("CAPE_ADMISSION_TIMEOUT_MS", 1000)
+# Load the machine reader on a background thread as soon as cape_responder.responder_core is imported
+WARM_UP_ON_IMPORT = os.getenv("CAPE_WARM_UP_ON_IMPORT", "false").lower() == "true"
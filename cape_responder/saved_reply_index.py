@@ -0,0 +1,184 @@
+# Copyright 2018 BLEMUNDSBURY AI LIMITED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from array import array
+from threading import Lock
+from typing import Iterable, List, Optional, Tuple
+import numpy as np
+from cape_responder.chunking import terms
+
+# Words carrying no meaning on their own, they are ignored unless a question has no other terms
+STOP_WORDS = frozenset("""
+a about an and are as at be been but by can could did do does for from had has have how i if in is it its me my
+of on or our should so than that the their them there these they this those to was we were what when where which
+who whom why will with would you your
+""".split())
+
+
+def question_terms(question: str) -> frozenset:
+    question_words = terms(question)
+    return frozenset(question_words - STOP_WORDS or question_words)
+
+
+def annotation_replies(annotation: dict) -> List[dict]:
+    """Answers of an AnnotationStore.get_annotations record, in the format of similar_annotations without confidence."""
+    document_id = annotation.get('sourceDocumentId')
+    return [{
+        "answerText": answer['answer'],
+        "answerContext": answer['answer'],
+        "sourceType": 'saved_reply' if document_id is None else 'annotation',
+        "sourceId": annotation['id'],
+        "answerTextStartOffset": annotation.get('startOffset'),
+        "answerTextEndOffset": annotation.get('endOffset'),
+        "answerContextStartOffset": annotation.get('startOffset'),
+        "answerContextEndOffset": annotation.get('endOffset'),
+        "documentId": document_id,
+        "page": annotation.get('page'),
+        "metadata": annotation.get('metadata'),
+    } for answer in annotation.get('answers', [])]
+
+
+def annotation_questions(annotation: dict) -> List[str]:
+    paraphrases = [paraphrase['question'] if isinstance(paraphrase, dict) else paraphrase
+                   for paraphrase in annotation.get('paraphraseQuestions', [])]
+    return [annotation['canonicalQuestion']] + paraphrases
+
+
+class SavedReplyIndex:
+    """
+    In memory similarity index of one user's saved reply and annotation questions. Similarity is the cosine of the
+    questions' tf-idf vectors, idf being computed over the indexed questions. Each term maps to the questions holding
+    it, so a lookup only visits the questions sharing a term with the question asked.
+    Annotations are added and removed incrementally.
+    """
+
+    def __init__(self):
+        # Questions are numbered in order of addition, the numbers of removed questions are not reused
+        self._questions = []
+        self._annotation_ids = []
+        self._document_ids = []
+        self._replies = {}
+        self._size = 0
+        self._vocabulary = {}
+        self._document_frequencies = np.zeros(16, dtype=np.int64)
+        # Question number and term ID of every term of every question, and question numbers of each term ID
+        self._entry_rows = array('q')
+        self._entry_terms = array('q')
+        self._postings = []
+        # Squared idf of each term ID and squared norm of each question, recomputed after changes
+        self._weights = None
+        self._lock = Lock()
+
+    def __len__(self):
+        return self._size
+
+    def add(self, annotation: dict):
+        """Indexes the questions of an AnnotationStore.get_annotations record, replacing any previous version."""
+        questions = annotation_questions(annotation)
+        with self._lock:
+            self._remove(annotation['id'])
+            rows = range(len(self._questions), len(self._questions) + len(questions))
+            for row, question in zip(rows, questions):
+                for term in question_terms(question):
+                    term_id = self._vocabulary.setdefault(term, len(self._vocabulary))
+                    if term_id == len(self._postings):
+                        self._postings.append(array('q'))
+                        if term_id == len(self._document_frequencies):
+                            self._document_frequencies = np.concatenate(
+                                [self._document_frequencies, np.zeros_like(self._document_frequencies)])
+                    self._postings[term_id].append(row)
+                    self._document_frequencies[term_id] += 1
+                    self._entry_rows.append(row)
+                    self._entry_terms.append(term_id)
+            self._questions.extend(questions)
+            self._annotation_ids.extend([annotation['id']] * len(questions))
+            self._document_ids.extend([annotation.get('sourceDocumentId')] * len(questions))
+            self._replies[annotation['id']] = (annotation_replies(annotation), rows)
+            self._size += len(questions)
+            self._weights = None
+
+    def remove(self, annotation_id: str):
+        with self._lock:
+            self._remove(annotation_id)
+
+    def _remove(self, annotation_id: str):
+        if annotation_id not in self._replies:
+            return
+        _, rows = self._replies.pop(annotation_id)
+        for row in rows:
+            for term in question_terms(self._questions[row]):
+                term_id = self._vocabulary[term]
+                self._postings[term_id].remove(row)
+                self._document_frequencies[term_id] -= 1
+        self._size -= len(rows)
+        self._weights = None
+
+    def _get_weights(self) -> Tuple[np.array, np.array]:
+        if self._weights is None:
+            # Smoothed idf
+            squared_idfs = np.square(np.log((1. + self._size) / (1. + self._document_frequencies)) + 1.)
+            entry_terms = np.array(self._entry_terms, dtype=np.int64)
+            squared_norms = np.bincount(np.array(self._entry_rows, dtype=np.int64),
+                                        weights=squared_idfs[entry_terms], minlength=len(self._questions))
+            self._weights = squared_idfs, squared_norms
+        return self._weights
+
+    def search(self, question: str, threshold: float, top_k: int, saved_replies: Optional[bool] = None,
+               document_ids: Optional[Iterable[str]] = None) -> List[dict]:
+        """
+        Returns the replies of the top_k annotations whose questions are the most similar to the question, with a
+        similarity of at least threshold, as similar_annotations does. Questions sharing no term never match.
+        :param saved_replies:   True for saved replies only, False for annotations only, None for both
+        :param document_ids:    Limit annotations to the given document IDs
+        """
+        asked_terms = question_terms(question)
+        document_ids = set(document_ids) if document_ids is not None else None
+        with self._lock:
+            term_ids = [self._vocabulary[term] for term in asked_terms
+                        if term in self._vocabulary and self._document_frequencies[self._vocabulary[term]]]
+            if not term_ids:
+                return []
+            squared_idfs, squared_norms = self._get_weights()
+            rows = np.concatenate([np.array(self._postings[term_id], dtype=np.int64) for term_id in term_ids])
+            candidates, inverse = np.unique(rows, return_inverse=True)
+            dot_products = np.bincount(inverse, weights=np.repeat(squared_idfs[term_ids],
+                                                                  self._document_frequencies[term_ids]))
+            # Terms no indexed question holds only count in the norm of the question asked
+            unknown_squared_idf = (np.log(1. + self._size) + 1.) ** 2
+            asked_squared_norm = squared_idfs[term_ids].sum() + unknown_squared_idf * (len(asked_terms) - len(term_ids))
+            scores = dot_products / np.sqrt(squared_norms[candidates] * asked_squared_norm)
+            keep = scores >= threshold
+            if saved_replies is not None or document_ids is not None:
+                keep &= np.array([(saved_replies is None or (self._document_ids[row] is None) == saved_replies)
+                                  and (document_ids is None or self._document_ids[row] is None
+                                       or self._document_ids[row] in document_ids)
+                                  for row in candidates.tolist()], dtype=bool)
+            candidates, scores = candidates[keep], scores[keep]
+            # Annotations can match through several paraphrases, keep enough rows to fill top_k distinct annotations
+            if len(candidates) > top_k * 4:
+                best = np.argpartition(-scores, top_k * 4 - 1)[:top_k * 4]
+                candidates, scores = candidates[best], scores[best]
+            results = []
+            seen = set()
+            for candidate_idx in np.argsort(-scores, kind='stable').tolist():
+                row = int(candidates[candidate_idx])
+                if self._annotation_ids[row] in seen:
+                    continue
+                seen.add(self._annotation_ids[row])
+                for reply in self._replies[self._annotation_ids[row]][0]:
+                    results.append(dict(reply, confidence=float(scores[candidate_idx]),
+                                        matchedQuestion=self._questions[row]))
+                if len(seen) == top_k:
+                    break
+        return results
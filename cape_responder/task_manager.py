@@ -12,27 +12,244 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+import inspect
 import os
-from dask.distributed import Client
-from cape_responder.responder_settings import CLUSTER_SCHEDULER_IP, CLUSTER_SCHEDULER_PORT
+import time
+from collections import defaultdict, deque
+from concurrent import futures as concurrent_futures
+from contextlib import contextmanager
+from functools import partial
+from multiprocessing import Pool, Semaphore
+from threading import Condition, Event, Lock
+from typing import Callable, Hashable, List, Optional, Tuple
+from cape_api_helpers.exceptions import UserException
+from cape_responder.responder_settings import CLUSTER_SCHEDULER_IP, CLUSTER_SCHEDULER_PORT, LOCAL_CLUSTER_WORKERS
 from logging import info
 
 CLUSTER_CLIENT = None
+ASYNC_CLUSTER_CLIENT = None
+WORKERS_REFRESH_SECONDS = 5
+WORKERS_POLL_SECONDS = 0.1
+_BACKGROUND_EXECUTOR = concurrent_futures.ThreadPoolExecutor()
+_NUMBER_OF_WORKERS = (None, 0., 1)
 ENABLE_PARALLELIZATION = os.getenv('ENABLE_PARALLELIZATION', 'false').lower() == 'true'
+# 'dask' for the cluster at CAPE_CLUSTER_SCHEDULER_IP, 'local' for a pool of local processes, 'dummy' to run serially
+EXECUTOR_BACKEND = os.getenv('CAPE_EXECUTOR_BACKEND', 'dask' if ENABLE_PARALLELIZATION else 'dummy').lower()
+# Dask runs the tasks of higher priority first, interactive questions go ahead of bulk work
+INTERACTIVE_PRIORITY = 10
+BULK_PRIORITY = 0
+ERROR_RESPONDER_OVERLOADED = 'The responder is overloaded, please retry later'
+# Set in worker processes before they import the responder, which then does not warm up an executor of its own
+IS_WORKER = False
 
 
 def connect():
     global CLUSTER_CLIENT
     if CLUSTER_CLIENT is None:
-        if ENABLE_PARALLELIZATION:
+        if EXECUTOR_BACKEND == 'dask':
             info("Parallelization ENABLED")
+            from dask.distributed import Client
             CLUSTER_CLIENT = Client(f'{CLUSTER_SCHEDULER_IP}:{CLUSTER_SCHEDULER_PORT}')  # Connect to the cluster
+        elif EXECUTOR_BACKEND == 'local':
+            info(f"Parallelization ENABLED on {LOCAL_CLUSTER_WORKERS} local processes")
+            CLUSTER_CLIENT = LocalProcessClient(LOCAL_CLUSTER_WORKERS)
         else:
             info("Parallelization DISABLED")
             CLUSTER_CLIENT = DummyClient()
     return CLUSTER_CLIENT
 
 
+async def connect_async():
+    """Returns a client whose futures can be awaited from the running event loop."""
+    global ASYNC_CLUSTER_CLIENT
+    if ASYNC_CLUSTER_CLIENT is None:
+        if EXECUTOR_BACKEND == 'dask':
+            info("Parallelization ENABLED")
+            from dask.distributed import Client
+            ASYNC_CLUSTER_CLIENT = await Client(f'{CLUSTER_SCHEDULER_IP}:{CLUSTER_SCHEDULER_PORT}', asynchronous=True)
+        elif EXECUTOR_BACKEND == 'local':
+            # Futures of the local pool can be awaited directly
+            ASYNC_CLUSTER_CLIENT = connect()
+        else:
+            info("Parallelization DISABLED")
+            ASYNC_CLUSTER_CLIENT = AsyncDummyClient()
+    return ASYNC_CLUSTER_CLIENT
+
+
+def _number_of_workers_is_stale(client) -> bool:
+    client_id, refreshed_at, _ = _NUMBER_OF_WORKERS
+    return client_id != id(client) or time.monotonic() - refreshed_at > WORKERS_REFRESH_SECONDS
+
+
+def _set_number_of_workers(client, ncores: dict) -> int:
+    global _NUMBER_OF_WORKERS
+    _NUMBER_OF_WORKERS = (id(client), time.monotonic(), max(1, sum(ncores.values())))
+    return _NUMBER_OF_WORKERS[2]
+
+
+def get_number_of_workers(client) -> int:
+    """Number of cores the client can currently run tasks on, refreshed every WORKERS_REFRESH_SECONDS."""
+    if _number_of_workers_is_stale(client):
+        return _set_number_of_workers(client, client.ncores())
+    return _NUMBER_OF_WORKERS[2]
+
+
+async def get_number_of_workers_async(client) -> int:
+    """get_number_of_workers for clients returned by connect_async."""
+    if _number_of_workers_is_stale(client):
+        ncores = client.ncores()
+        if inspect.isawaitable(ncores):
+            ncores = await ncores
+        return _set_number_of_workers(client, ncores)
+    return _NUMBER_OF_WORKERS[2]
+
+
+def wait_first(futures, timeout: Optional[float] = None) -> Tuple[List, List]:
+    """
+    Waits until at least one of the futures completes or the timeout, in seconds, expires.
+    Returns the lists of done and not done futures.
+    """
+    if futures and not any(future.done() for future in futures):
+        completed = Event()
+        for future in futures:
+            future.add_done_callback(lambda _: completed.set())
+        completed.wait(timeout)
+    return [future for future in futures if future.done()], [future for future in futures if not future.done()]
+
+
+def as_completed_batches(futures):
+    """Yields lists of the given futures as they complete, futures finishing together share a list."""
+    not_done = list(futures)
+    while not_done:
+        done, not_done = wait_first(not_done)
+        yield done
+
+
+def wait_for_workers(client, timeout: Optional[float] = None) -> bool:
+    """
+    Blocks until the client's workers are ready to take tasks, or the timeout in seconds expires, and returns whether
+    they are. Local processes are ready once they have all run their initializer, dask workers once one has registered
+    with the scheduler, after running its preload.
+    """
+    if isinstance(client, LocalProcessClient):
+        return client.wait_until_started(timeout)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while not client.ncores():
+        if deadline is not None and time.monotonic() >= deadline:
+            return False
+        time.sleep(WORKERS_POLL_SECONDS)
+    return True
+
+
+def initialize_worker():
+    """Warms up a worker process, see Responder.warm_up_machine_reader."""
+    global IS_WORKER
+    IS_WORKER = True
+    from cape_responder.responder_core import Responder
+    Responder.warm_up_machine_reader()
+
+
+def _initialize_process(initializer: Optional[Callable[[], None]], started):
+    if initializer is not None:
+        initializer()
+    started.release()
+
+
+def scatter(client, data: list) -> list:
+    """
+    Sends the items of data straight to the workers of a blocking dask client, bypassing the scheduler, and returns
+    references to them: tasks taking a reference then run on the worker already holding its item.
+    Other clients get the data back unchanged.
+    Keys are unique to each call, identical data scattered by concurrent requests is never shared, and the workers
+    release an item once its reference is dropped: callers keep the references until their answers are gathered.
+    """
+    if not hasattr(client, 'scatter') or getattr(client, 'asynchronous', False):
+        return data
+    return client.scatter(data, hash=False)
+
+
+class ResponderOverloadedException(UserException):
+    """Raised when a request is not admitted, the responder already has too much work."""
+
+    def __init__(self):
+        super().__init__(ERROR_RESPONDER_OVERLOADED)
+
+
+class AdmissionControl:
+    """
+    Limits the requests each tenant runs concurrently, requests over the limit wait for a slot for up to timeout
+    seconds. Requests arriving while max_pending requests are already running or waiting are rejected straight away.
+    A limit of 0 means unlimited.
+    """
+
+    def __init__(self, max_concurrent_per_tenant: int, max_pending: int, timeout: float):
+        self.max_concurrent_per_tenant = max_concurrent_per_tenant
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._running = defaultdict(int)
+        self._pending = 0
+        self._condition = Condition()
+
+    def _has_slot(self, tenant: Hashable) -> bool:
+        return not self.max_concurrent_per_tenant or self._running[tenant] < self.max_concurrent_per_tenant
+
+    @contextmanager
+    def admit(self, tenant: Hashable, timeout: Optional[float] = None):
+        """Runs the block once the tenant has a free slot, raises ResponderOverloadedException otherwise."""
+        timeout = self.timeout if timeout is None else timeout
+        with self._condition:
+            if self.max_pending and self._pending >= self.max_pending:
+                raise ResponderOverloadedException()
+            self._pending += 1
+            if not self._condition.wait_for(partial(self._has_slot, tenant), timeout):
+                self._pending -= 1
+                raise ResponderOverloadedException()
+            self._running[tenant] += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._pending -= 1
+                self._running[tenant] -= 1
+                if not self._running[tenant]:
+                    del self._running[tenant]
+                self._condition.notify_all()
+
+
+def run_in_background(funct, *args, **kwargs) -> concurrent_futures.Future:
+    """Runs a blocking call of the front end, such as a store lookup, on a thread of this process."""
+    return _BACKGROUND_EXECUTOR.submit(funct, *args, **kwargs)
+
+
+def cancel(futures):
+    """Cancels the given futures, tasks already running on a worker may still complete."""
+    for future in futures:
+        future.cancel()
+
+
+class CancellationToken:
+    """Lets a caller cancel the worker tasks a request dispatched from another thread."""
+
+    def __init__(self):
+        self.cancelled = False
+        self._futures = []
+        self._lock = Lock()
+
+    def track(self, futures):
+        with self._lock:
+            self._futures.extend(futures)
+            cancelled = self.cancelled
+        if cancelled:
+            cancel(futures)
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            futures = self._futures
+        cancel(futures)
+
+
 class DummyResult:
     def __init__(self, value):
         self.value = value
@@ -40,17 +257,156 @@ class DummyResult:
     def result(self):
         return self.value
 
+    def done(self):
+        return True
+
+    def cancel(self):
+        return False
+
 
 class DummyClient:
-    def submit(self, funct, *args, **kwargs):
+    def ncores(self):
+        return {'dummy': 1}
+
+    def submit(self, funct, *args, priority: int = 0, **kwargs):
         if args and isinstance(args[0], list) and getattr(args[0][0], 'result', False):
             args = ([arg.result() for arg in args[0]],) + args[1:]
         return DummyResult(funct(*args, **kwargs))
 
-    def map(self, funct, args):
+    def map(self, funct, args, priority: int = 0):
         if args and getattr(args[0], 'result', False):
             args = [arg.result() for arg in args]
         return [DummyResult(funct(arg)) for arg in args]
 
     def gather(self, funct, *args, **kwargs):
         return [DummyResult(funct(arg)) for arg in args]
+
+
+class AsyncDummyClient:
+    """DummyClient for asyncio callers, tasks run in the event loop's default executor."""
+
+    def ncores(self):
+        return {'dummy': 1}
+
+    def submit(self, funct, *args, priority: int = 0, **kwargs):
+        return asyncio.ensure_future(self._run(funct, *args, **kwargs))
+
+    def map(self, funct, args, priority: int = 0):
+        return [self.submit(funct, arg) for arg in args]
+
+    async def _run(self, funct, *args, **kwargs):
+        if args and isinstance(args[0], list) and args[0] and isinstance(args[0][0], asyncio.Future):
+            args = (list(await asyncio.gather(*args[0])),) + args[1:]
+        return await asyncio.get_event_loop().run_in_executor(None, partial(funct, *args, **kwargs))
+
+
+class LocalFuture(concurrent_futures.Future):
+    """Future of a LocalProcessClient task, it can also be awaited from an event loop."""
+
+    def __await__(self):
+        return asyncio.wrap_future(self).__await__()
+
+
+class LocalProcessClient:
+    """
+    Runs tasks on a pool of local processes, each process runs the initializer once when it starts, by default
+    loading the machine reader. Exposes the submit/map surface of the dask client, futures passed in a list as first
+    argument are resolved. Tasks run in submission order whatever their priority.
+    """
+
+    def __init__(self, number_of_workers: int, initializer: Optional[Callable[[], None]] = initialize_worker):
+        self.number_of_workers = number_of_workers
+        # Released by each process once its initializer has run
+        self._started = Semaphore(0)
+        self._number_started = 0
+        self._started_lock = Lock()
+        self.pool = Pool(number_of_workers, initializer=_initialize_process, initargs=(initializer, self._started))
+        self._queue = deque()
+        self._number_running = 0
+        self._lock = Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Stops the worker processes, tasks not completed yet are abandoned."""
+        self.pool.terminate()
+        self.pool.join()
+
+    def wait_until_started(self, timeout: Optional[float] = None) -> bool:
+        """
+        Blocks until every process has run the initializer, or the timeout in seconds expires, and returns whether
+        they all have.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._started_lock:
+            while self._number_started < self.number_of_workers:
+                remaining = None if deadline is None else max(0., deadline - time.monotonic())
+                if not self._started.acquire(True, remaining):
+                    return False
+                self._number_started += 1
+        return True
+
+    def ncores(self):
+        return {f'local-{idx}': 1 for idx in range(self.number_of_workers)}
+
+    def submit(self, funct, *args, priority: int = 0, **kwargs):
+        future = LocalFuture()
+        if args and isinstance(args[0], list) and args[0] and isinstance(args[0][0], concurrent_futures.Future):
+            self._submit_when_done(future, args[0], funct, args[1:], kwargs)
+        else:
+            self._apply(future, funct, args, kwargs)
+        return future
+
+    def map(self, funct, args, priority: int = 0):
+        return [self.submit(funct, arg) for arg in args]
+
+    def _apply(self, future: LocalFuture, funct, args, kwargs):
+        with self._lock:
+            self._queue.append((future, funct, args, kwargs))
+        self._start_tasks()
+
+    def _start_tasks(self):
+        # Tasks are only handed to the pool once a process is free, until then they are pending and can be cancelled
+        while True:
+            with self._lock:
+                if self._number_running >= self.number_of_workers or not self._queue:
+                    return
+                future, funct, args, kwargs = self._queue.popleft()
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self._number_running += 1
+            self.pool.apply_async(funct, args, kwargs, callback=partial(self._task_done, future, False),
+                                  error_callback=partial(self._task_done, future, True))
+
+    def _task_done(self, future: LocalFuture, failed: bool, value):
+        with self._lock:
+            self._number_running -= 1
+        self._start_tasks()
+        if failed:
+            future.set_exception(value)
+        else:
+            future.set_result(value)
+
+    def _submit_when_done(self, future: LocalFuture, dependencies, funct, args, kwargs):
+        remaining = [len(dependencies)]
+        lock = Lock()
+
+        def on_dependency_done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            try:
+                values = [dependency.result() for dependency in dependencies]
+            except BaseException as exception:
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(exception)
+                return
+            self._apply(future, funct, (values,) + tuple(args), kwargs)
+
+        for dependency in dependencies:
+            dependency.add_done_callback(on_dependency_done)
@@ -0,0 +1,80 @@
+# Copyright 2018 BLEMUNDSBURY AI LIMITED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+from cape_responder.caches import LRUCache, DocumentVersions, SingleFlight, normalise_question
+
+
+def test_lru_cache_eviction_and_stats():
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert 'b' not in cache
+    assert cache.get('b') is None
+    assert cache.get_or_compute('c', lambda: 4) == 3
+    stats = cache.stats()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 1
+    assert stats['size'] == 2
+
+
+def test_normalise_question():
+    assert normalise_question('  What   is\tthis? ') == 'What is this?'
+
+
+def test_lru_cache_ttl():
+    cache = LRUCache(2, ttl=-1)
+    cache.put('a', 1)
+    assert cache.get('a') is None
+    assert 'a' not in cache
+
+
+def test_document_versions():
+    versions = DocumentVersions()
+    all_documents = versions.key('fake-user', None)
+    some_documents = versions.key('fake-user', ['doc2', 'doc1'])
+    assert some_documents == versions.key('fake-user', ['doc1', 'doc2'])
+    versions.bump('fake-user', ['doc1'])
+    assert versions.key('fake-user', None) != all_documents
+    assert versions.key('fake-user', ['doc1', 'doc2']) != some_documents
+    assert versions.key('fake-user', ['doc2']) == (('doc2', 0),)
+
+
+def test_single_flight():
+    single_flight = SingleFlight()
+    started = Event()
+    release = Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return ['answer']
+
+    with ThreadPoolExecutor(4) as executor:
+        leader = executor.submit(single_flight.do, 'key', compute)
+        started.wait()
+        followers = [executor.submit(single_flight.do, 'key', compute) for _ in range(3)]
+        # Let the followers reach the in flight call
+        time.sleep(0.2)
+        release.set()
+        assert [future.result() for future in [leader] + followers] == [['answer']] * 4
+    assert len(calls) == 1
+    assert len(single_flight) == 0
+    assert single_flight.do('key', lambda: ['again']) == ['again']
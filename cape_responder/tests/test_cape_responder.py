@@ -12,10 +12,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from cape_responder import responder_core
 from cape_responder.responder_core import Responder
+from cape_responder.caches import LRUCache
+from cape_responder.objects.chunk import Chunk
+from cape_responder.objects.responder_answer import Response
+from cape_responder.task_manager import CancellationToken
 from cape_document_manager.document_store import DocumentStore
 from cape_document_manager.annotation_store import AnnotationStore
 from pprint import pprint
+from concurrent.futures import CancelledError
+import asyncio
+import pickle
+import numpy as np
 import pytest
 
 
@@ -60,3 +69,200 @@ def test_annotation():
     assert response[0]['page'] == 3
     assert response[0]['metadata']['test'] == True
 
+
+
+@pytest.mark.usefixtures('cleanup')
+def test_saved_reply_index(monkeypatch):
+    monkeypatch.setattr(responder_core, 'SAVED_REPLY_INDEX_ENABLED', True)
+    monkeypatch.setattr(Responder, '_SAVED_REPLY_INDEXES', LRUCache(10, ttl=60))
+    Responder.create_annotation('fake-user', 'What is the time?', 'Lunch time!')
+    response = Responder.get_answers_from_similar_questions('fake-user', 'What time is it?')
+    assert response[0]['answerText'] == 'Lunch time!'
+    # A question only sharing stop words with the saved reply does not stop the document search
+    DocumentStore.create_document('fake-user', 'doc1', 'Test document', 'This is a test', replace=True, document_id='doc1')
+    response = Responder.get_answers('fake-user', 'What is the price?', document_ids=['doc1'])
+    assert response[0]['sourceId'] == 'doc1'
+
+
+@pytest.mark.usefixtures('cleanup')
+def test_machine_reader_logits():
+    DocumentStore.create_document('fake-user', 'doc1', 'Test document', 'This is a test. ' * 200, replace=True,
+                                  document_id='doc1')
+    chunks = Responder.search_chunks('fake-user', 'What is this?', ['doc1'], None)
+    logits = Responder.machine_reader_logits('What is this?', chunks)
+    assert len(logits) == len(chunks)
+    for chunk, (chunk_logits, overlap) in zip(chunks, logits):
+        expected_logits, expected_overlap = Responder.get_machine_reader().get_logits(
+            chunk.text, 'What is this?', chunk.overlap_before, chunk.overlap_after)
+        assert overlap == expected_overlap
+        assert np.allclose(chunk_logits[0], expected_logits[0])
+
+
+@pytest.mark.usefixtures('cleanup')
+def test_answer_cache(monkeypatch):
+    monkeypatch.setattr(responder_core, 'ANSWER_CACHE_SIZE', 10)
+    monkeypatch.setattr(Responder, '_ANSWERS', LRUCache(10))
+    Responder.create_document('fake-user', 'doc1', 'Test document', 'This is a test', replace=True, document_id='doc1')
+    response = Responder.get_answers_from_documents('fake-user', 'What is this?', document_ids=['doc1'])
+    assert Responder.get_answers_from_documents('fake-user', 'What  is this?', document_ids=['doc1']) == response
+    assert Responder._ANSWERS.hits == 1
+    Responder.create_document('fake-user', 'doc1', 'Test document', 'This is Tuesday', replace=True,
+                              document_id='doc1')
+    response = Responder.get_answers_from_documents('fake-user', 'What is this?', document_ids=['doc1'])
+    assert Responder._ANSWERS.hits == 1
+    assert 'Tuesday' in response[0]['answerText']
+    # The document ID may also be passed positionally
+    Responder.create_document('fake-user', 'doc1', 'Test document', 'This is a test', 'doc1', True)
+    assert Responder.get_answers_from_documents('fake-user', 'What is this?', document_ids=['doc1']) != response
+    assert Responder._ANSWERS.hits == 1
+
+
+@pytest.mark.usefixtures('cleanup')
+def test_cancelled_answers_are_not_cached(monkeypatch):
+    monkeypatch.setattr(responder_core, 'ANSWER_CACHE_SIZE', 10)
+    monkeypatch.setattr(Responder, '_ANSWERS', LRUCache(10))
+    DocumentStore.create_document('fake-user', 'doc1', 'Test document', 'This is a test', replace=True, document_id='doc1')
+    cancellation = CancellationToken()
+    cancellation.cancel()
+    with pytest.raises(CancelledError):
+        Responder.get_answers_from_documents('fake-user', 'What is this?', document_ids=['doc1'],
+                                             cancellation=cancellation)
+    assert len(Responder._ANSWERS) == 0
+    assert len(Responder.get_answers_from_documents('fake-user', 'What is this?', document_ids=['doc1'])) > 0
+
+@pytest.mark.usefixtures('cleanup')
+def test_documents_async():
+    DocumentStore.create_document('fake-user', 'doc1', 'Test document', 'This is a test', replace=True, document_id='doc1')
+    loop = asyncio.get_event_loop()
+    response = loop.run_until_complete(
+        Responder.get_answers_from_documents_async('fake-user', 'What is this?', document_ids=['doc1']))
+    assert response == Responder.get_answers_from_documents('fake-user', 'What is this?', document_ids=['doc1'])
+
+
+@pytest.mark.usefixtures('cleanup')
+def test_documents_stream(monkeypatch):
+    # The last answers streamed are those of get_answers_from_documents when workers return their top answers
+    monkeypatch.setattr(responder_core, 'WORKER_TOP_K', True)
+    DocumentStore.create_document('fake-user', 'doc1', 'Test document', 'This is a test. ' * 200, replace=True,
+                                  document_id='doc1')
+    responses = list(Responder.get_answers_from_documents_stream('fake-user', 'What is this?', document_ids=['doc1'],
+                                                                 speed_or_accuracy='total'))
+    assert len(responses) >= 1
+    assert responses[-1] == Responder.get_answers_from_documents('fake-user', 'What is this?', document_ids=['doc1'],
+                                                                 speed_or_accuracy='total')
+
+
+@pytest.mark.usefixtures('cleanup')
+def test_partition_chunks():
+    DocumentStore.create_document('fake-user', 'doc1', 'Test document', 'This is a test. ' * 2000, replace=True,
+                                  document_id='doc1')
+    chunks = Responder.search_chunks('fake-user', 'What is this?', ['doc1'], None)
+    worker_chunks = Responder.partition_chunks(chunks, 2)
+    assert 1 <= len(worker_chunks) <= 2 * responder_core.MAX_TASKS_PER_WORKER
+    assert sorted(id(chunk) for chunk_slice in worker_chunks for chunk in chunk_slice) == sorted(map(id, chunks))
+    costs = [sum(map(Responder.estimate_chunk_cost, chunk_slice)) for chunk_slice in worker_chunks]
+    assert max(costs) - min(costs) <= max(map(Responder.estimate_chunk_cost, chunks))
+
+
+def test_translate_spans():
+    chunks = [[Chunk('doc1', 'This is', (10, 17), '', ''), Chunk('doc2', 'a test', (0, 6), '', '')]]
+    flat_logits, flat_overlaps, flat_text, positions = Responder.combine_chunks([[(None, (0, 0))] * 2], chunks)
+    assert flat_text == ' This is a test'
+    assert flat_text[9:15] == 'a test'
+    assert Responder.translate_spans([(9, 10), (1, 5)], [(6, 15), (1, 8)], positions) == [
+        ('doc2', 0, 1, 0, 6, 3, 0), ('doc1', 10, 14, 10, 17, 0, 0)]
+
+
+def test_chunk_wire_format():
+    chunk = Chunk('doc1', 'This is a test', (10, 24), 'before', 'after', 'Q0VNQg==')
+    copy = pickle.loads(pickle.dumps(chunk))
+    assert [getattr(copy, field) for field in Chunk.__slots__] == [getattr(chunk, field) for field in Chunk.__slots__]
+    reduce_copy = chunk.for_reduce()
+    assert (reduce_copy.document_id, reduce_copy.text, reduce_copy.text_span) == ('doc1', 'This is a test', (10, 24))
+    assert reduce_copy.embedding == reduce_copy.overlap_before == reduce_copy.overlap_after == ''
+
+
+@pytest.mark.usefixtures('cleanup')
+def test_worker_top_k(monkeypatch):
+    DocumentStore.create_document('fake-user', 'doc1', 'Test document', 'This is a test. ' * 2000, replace=True,
+                                  document_id='doc1')
+    expected = Responder.get_answers_from_documents('fake-user', 'What is this?', document_ids=['doc1'],
+                                                    number_of_items=3, speed_or_accuracy='total')
+    monkeypatch.setattr(responder_core, 'WORKER_TOP_K', True)
+    response = Responder.get_answers_from_documents('fake-user', 'What is this?', document_ids=['doc1'],
+                                                    number_of_items=3, speed_or_accuracy='total')
+    assert [answer['sourceId'] for answer in response] == [answer['sourceId'] for answer in expected]
+    assert [answer['confidence'] for answer in response] == pytest.approx([answer['confidence'] for answer in expected])
+
+
+@pytest.mark.usefixtures('cleanup')
+def test_inline_text_is_not_stored():
+    hits = Responder._INLINE_TEXT_CHUNKS.hits
+    for _ in range(2):
+        response = Responder.get_answers_from_documents('fake-user', 'what day is today ?', text='Today is Monday.')
+        assert 'Monday' in response[0]['answerText']
+    assert Responder._INLINE_TEXT_CHUNKS.hits == hits + 1
+    assert not any(document['id'].startswith('Inline text-') for document in DocumentStore.get_documents('fake-user'))
+
+
+@pytest.mark.usefixtures('cleanup')
+def test_documents_batch():
+    DocumentStore.create_document('fake-user', 'doc1', 'Test document', 'This is a test. Today is Tuesday.',
+                                  replace=True, document_id='doc1')
+    questions = ['What is this?', 'What day is today?']
+    responses = Responder.get_answers_from_documents_batch('fake-user', questions, document_ids=['doc1'])
+    assert len(responses) == 2
+    for question, response in zip(questions, responses):
+        expected = Responder.get_answers_from_documents('fake-user', question, document_ids=['doc1'])
+        assert response[0]['answerText'] == expected[0]['answerText']
+    assert 'Tuesday' in responses[1][0]['answerText']
+
+
+@pytest.mark.usefixtures('cleanup')
+def test_answers_from_saved_replies_and_documents():
+    AnnotationStore.create_annotation('fake-user', 'What is the time?', 'Lunch time!')
+    DocumentStore.create_document('fake-user', 'doc1', 'Test document', 'This is a test', replace=True, document_id='doc1')
+    response = Responder.get_answers('fake-user', 'What is the time?', document_ids=['doc1'])
+    assert response[0]['answerText'] == 'Lunch time!'
+    response = Responder.get_answers('fake-user', 'What is this?', document_ids=['doc1'], early_exit=False,
+                                     number_of_items=5)
+    assert any(answer['sourceId'] == 'doc1' for answer in response)
+
+
+@pytest.mark.usefixtures('cleanup')
+def test_documents_time_budget():
+    DocumentStore.create_document('fake-user', 'doc1', 'Test document', 'This is a test. Today is Tuesday.',
+                                  replace=True, document_id='doc1')
+    response = Responder.get_answers_from_documents('fake-user', 'What day is today?', document_ids=['doc1'],
+                                                    time_budget_ms=60000)
+    expected = Responder.get_answers_from_documents('fake-user', 'What day is today?', document_ids=['doc1'])
+    assert response[0]['answerText'] == expected[0]['answerText']
+    assert Responder.get_answers_from_documents('fake-user', 'What day is today?', document_ids=['doc1'],
+                                                time_budget_ms=0) == []
+
+
+def test_response_slices():
+    response = Response('Tuesday and more', 'Today is Tuesday and more', 0.5, 'doc1', 'document', 9, 16, 0, 16,
+                        answer_text_slice=slice(7), answer_context_slice=slice(None, -9))
+    assert response.answer_text == 'Tuesday'
+    assert pickle.loads(pickle.dumps(response)).to_dict() == response.to_dict() == {
+        'answerText': 'Tuesday', 'answerContext': 'Today is Tuesday', 'confidence': 0.5, 'sourceType': 'document',
+        'sourceId': 'doc1', 'answerTextStartOffset': 9, 'answerTextEndOffset': 16, 'answerContextStartOffset': 0,
+        'answerContextEndOffset': 16}
+
+
+def test_rerank_chunks():
+    chunks = [Chunk('doc1', 'Nothing to see', (0, 14), '', ''), Chunk('doc1', 'Today is Tuesday', (15, 31), '', ''),
+              Chunk('doc2', 'What a day', (0, 10), '', ''), Chunk('doc2', 'Unrelated', (11, 20), '', '')]
+    assert Responder.rerank_chunks('What day is today?', chunks, 1) == chunks
+    assert Responder.rerank_chunks('What day is today?', chunks, 0.5) == [chunks[1], chunks[2]]
+    assert Responder.rerank_chunks('What day is today?', chunks, 1, score_floor=0.5) == [chunks[1], chunks[2]]
+    assert Responder.rerank_chunks('What day is today?', chunks, 0.25, score_floor=0.5) == [chunks[1]]
+    # The best chunk is kept even below the floor
+    assert Responder.rerank_chunks('Who?', chunks, 0.5, score_floor=0.5) == [chunks[0]]
+
+
+def test_warm_up():
+    Responder.warm_up()
+    assert Responder.is_ready()
+    assert Responder.wait_until_ready(timeout=0)
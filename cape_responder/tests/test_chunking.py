@@ -0,0 +1,29 @@
+# Copyright 2018 BLEMUNDSBURY AI LIMITED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from cape_responder.chunking import chunk_text, lexical_overlap_scores
+
+
+def test_chunk_text():
+    text = ' '.join('word{}'.format(idx) for idx in range(10))
+    chunks = chunk_text('doc1', text, 4, 1)
+    assert [chunk.text for chunk in chunks] == ['word0 word1 word2 word3', 'word4 word5 word6 word7', 'word8 word9']
+    for chunk in chunks:
+        assert text[chunk.text_span[0]:chunk.text_span[1]] == chunk.text
+    assert chunks[1].overlap_before == 'word3 '
+    assert chunks[1].overlap_after == ' word8'
+
+
+def test_lexical_overlap_scores():
+    assert lexical_overlap_scores('What day is it?', ['Today is Tuesday', 'What day']) == [0.25, 0.5]
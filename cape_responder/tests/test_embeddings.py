@@ -0,0 +1,62 @@
+# Copyright 2018 BLEMUNDSBURY AI LIMITED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import numpy as np
+from cape_responder.embeddings import embedding_from_field, embedding_to_field
+
+
+def test_embedding_field_round_trip():
+    embedding = np.random.rand(7, 3)
+    field = embedding_to_field(embedding)
+    decoded = embedding_from_field(field)
+    assert decoded.dtype == np.float32
+    assert decoded.shape == (7, 3)
+    assert np.allclose(decoded, embedding)
+    assert len(field) < len(json.dumps(embedding.tolist()))
+
+
+def test_embedding_field_float16():
+    embedding = np.random.rand(4, 2)
+    decoded = embedding_from_field(embedding_to_field(embedding, 'float16'))
+    assert decoded.dtype == np.float16
+    assert np.allclose(decoded, embedding, atol=1e-3)
+
+
+def test_legacy_json_embedding_field():
+    embedding = np.random.rand(2, 2)
+    assert np.allclose(embedding_from_field(json.dumps(embedding.tolist())), embedding)
+
+
+def test_embedding_field_int8():
+    embedding = np.random.randn(5, 16)
+    embedding[2] = 0
+    field = embedding_to_field(embedding, 'int8')
+    decoded = embedding_from_field(field)
+    assert decoded.dtype == np.float32
+    assert decoded.shape == (5, 16)
+    assert np.allclose(decoded, embedding, atol=np.abs(embedding).max() / 127)
+    assert len(field) < len(embedding_to_field(embedding, 'float16'))
+
+
+def test_int8_embedding_keeps_answers():
+    # Token logits of a linear reader over the embedding, the best spans must not move once quantised
+    random = np.random.RandomState(0)
+    embedding = random.randn(300, 64).astype(np.float32)
+    start_weights, end_weights = random.randn(64), random.randn(64)
+    decoded = embedding_from_field(embedding_to_field(embedding, 'int8'))
+    for weights in (start_weights, end_weights):
+        logits, decoded_logits = embedding @ weights, decoded @ weights
+        assert np.allclose(decoded_logits, logits, atol=0.05 * np.abs(logits).max())
+        assert list(np.argsort(-decoded_logits)[:5]) == list(np.argsort(-logits)[:5])
@@ -0,0 +1,79 @@
+# Copyright 2018 BLEMUNDSBURY AI LIMITED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from cape_responder import instrumentation
+
+
+def test_disabled_instrumentation_records_nothing():
+    instrumentation.disable()
+    instrumentation.reset()
+    with instrumentation.request('request'), instrumentation.stage('stage'):
+        instrumentation.count('chunks', 3)
+    assert instrumentation.snapshot() == {'stages': {}, 'counters': {}}
+
+
+def test_request_record_and_prometheus_text():
+    records = []
+    instrumentation.enable()
+    instrumentation.reset()
+    instrumentation.add_exporter(records.append)
+    try:
+        @instrumentation.instrumented('search')
+        def search():
+            instrumentation.count('chunks', 3)
+
+        with instrumentation.request('get_answers_from_documents'):
+            search()
+            search()
+    finally:
+        instrumentation.remove_exporter(records.append)
+        instrumentation.disable()
+    assert len(records) == 1
+    assert records[0]['request'] == 'get_answers_from_documents'
+    assert records[0]['counters'] == {'chunks': 6}
+    assert records[0]['stages']['search'] <= records[0]['seconds']
+    text = instrumentation.prometheus_text()
+    assert 'cape_responder_stage_seconds_count{stage="search"} 2' in text
+    assert 'cape_responder_total{name="chunks"} 6' in text
+
+
+def test_worker_task_stages_are_recorded_by_the_request():
+    records = []
+    instrumentation.enable()
+    instrumentation.reset()
+    instrumentation.add_exporter(records.append)
+    try:
+        @instrumentation.instrumented('read')
+        def read(number_of_chunks):
+            instrumentation.count('chunks', number_of_chunks)
+            return number_of_chunks
+
+        with ThreadPoolExecutor(1) as executor:
+            worker_results = [executor.submit(instrumentation.run_task, read, 2).result(),
+                              executor.submit(instrumentation.run_task, read, 3).result()]
+            # Worker threads record nothing themselves
+            assert instrumentation.snapshot() == {'stages': {}, 'counters': {}}
+            with instrumentation.request('get_answers_from_documents'):
+                submitted_at = time.perf_counter()
+                reduced = executor.submit(instrumentation.run_task, lambda results: sum(
+                    instrumentation.task_result(result) for result in results), worker_results).result()
+                assert instrumentation.task_result(reduced, submitted_at) == 5
+    finally:
+        instrumentation.remove_exporter(records.append)
+        instrumentation.disable()
+    assert records[0]['counters'] == {'chunks': 5}
+    assert set(records[0]['stages']) == {'read', 'scheduling'}
+    assert instrumentation.snapshot()['stages']['read']['count'] == 2
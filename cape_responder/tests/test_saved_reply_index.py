@@ -0,0 +1,68 @@
+# Copyright 2018 BLEMUNDSBURY AI LIMITED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from cape_responder.responder_core import THRESHOLD_MAP
+from cape_responder.saved_reply_index import SavedReplyIndex
+
+
+def annotation(annotation_id, question, answer, paraphrases=(), document_id=None):
+    return {'id': annotation_id, 'canonicalQuestion': question, 'answers': [{'answer': answer}],
+            'paraphraseQuestions': [{'question': paraphrase} for paraphrase in paraphrases],
+            'sourceDocumentId': document_id}
+
+
+def test_saved_reply_index_search():
+    index = SavedReplyIndex()
+    index.add(annotation('time', 'What is the time?', 'Lunch time!', paraphrases=['When is lunch?']))
+    index.add(annotation('name', 'What is your name?', 'Cape', document_id='doc1'))
+    index.add(annotation('this', 'What is this?', 'A test'))
+    results = index.search('when is lunch', 0.6, 10)
+    assert [result['answerText'] for result in results] == ['Lunch time!']
+    assert results[0]['confidence'] > 0.99
+    assert results[0]['matchedQuestion'] == 'When is lunch?'
+    assert results[0]['sourceType'] == 'saved_reply'
+    assert [result['sourceId'] for result in index.search('What is your name?', 0.6, 10)] == ['name']
+    assert index.search('What is your name?', 0.6, 10, saved_replies=True) == []
+    assert index.search('What is your name?', 0.6, 10, document_ids=['doc2']) == []
+    # Questions made of stop words only keep them
+    assert [result['sourceId'] for result in index.search('What is this', 0., 10)] == ['this']
+
+
+def test_saved_reply_index_thresholds():
+    thresholds = THRESHOLD_MAP['savedreply']
+    index = SavedReplyIndex()
+    index.add(annotation('time', 'What is the time?', 'Lunch time!'))
+    index.add(annotation('password', 'How do I reset my password?', 'Use the reset link'))
+    index.add(annotation('capital', 'What is the capital of Spain?', 'Madrid'))
+    assert [result['sourceId'] for result in index.search('What time is it?', thresholds['VERYHIGH'], 10)] == ['time']
+    assert [result['sourceId'] for result in
+            index.search('How can I reset my password?', thresholds['VERYHIGH'], 10)] == ['password']
+    # Sharing stop words is not a match
+    assert index.search('What is the price?', thresholds['VERYLOW'], 10) == []
+    # Partial matches stay below the confidence at which get_answers stops reading documents
+    for question in ['What is the capital of France?', 'How do I change my password?']:
+        results = index.search(question, thresholds['LOW'], 10)
+        assert len(results) == 1
+        assert results[0]['confidence'] < thresholds['VERYHIGH']
+
+
+def test_saved_reply_index_updates():
+    index = SavedReplyIndex()
+    index.add(annotation('time', 'What is the time?', 'Lunch time!'))
+    index.add(annotation('time', 'What is the time?', 'Tea time!'))
+    assert len(index) == 1
+    assert index.search('What is the time?', 0.5, 10)[0]['answerText'] == 'Tea time!'
+    index.remove('time')
+    assert len(index) == 0
+    assert index.search('What is the time?', 0.5, 10) == []
@@ -0,0 +1,88 @@
+# Copyright 2018 BLEMUNDSBURY AI LIMITED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import time
+from operator import neg
+from concurrent import futures as concurrent_futures
+import pytest
+from cape_responder.task_manager import DummyClient, LocalProcessClient, CancellationToken, as_completed_batches, \
+    AdmissionControl, ResponderOverloadedException, wait_for_workers
+
+
+def test_dummy_client():
+    client = DummyClient()
+    future_answers = client.map(neg, [1, 2, 3])
+    assert client.submit(sum, future_answers).result() == -6
+    assert [[future.result() for future in futures] for futures in as_completed_batches(future_answers)] == [[-1, -2, -3]]
+
+
+def test_local_process_client():
+    # Without an initializer the worker processes do not load the machine reader
+    with LocalProcessClient(1, initializer=None) as client:
+        future_answers = client.map(neg, [1, 2, 3])
+        assert client.submit(sum, future_answers).result() == -6
+        assert sorted(future.result() for futures in as_completed_batches(future_answers) for future in futures) == [-3, -2, -1]
+        assert asyncio.get_event_loop().run_until_complete(client.submit(neg, 4)) == -4
+
+
+def _slow_initializer():
+    time.sleep(0.5)
+
+
+def test_wait_for_workers():
+    assert wait_for_workers(DummyClient(), timeout=0)
+    with LocalProcessClient(2, initializer=_slow_initializer) as client:
+        assert not wait_for_workers(client, timeout=0)
+        assert wait_for_workers(client, timeout=30)
+        assert client.wait_until_started(timeout=0)
+
+
+def test_cancellation_token():
+    with LocalProcessClient(1, initializer=None) as client:
+        cancellation = CancellationToken()
+        blocker = concurrent_futures.Future()
+        future = client.submit(sum, [blocker])
+        cancellation.track([future])
+        cancellation.cancel()
+        blocker.set_result(1)
+        assert future.cancelled()
+
+
+def test_local_process_client_cancels_queued_tasks():
+    with LocalProcessClient(1, initializer=None) as client:
+        running = client.submit(time.sleep, 0.5)
+        queued = client.submit(neg, 1)
+        # The only process is busy, the second task has not been handed to the pool
+        assert queued.cancel()
+        assert running.result() is None
+        assert queued.cancelled()
+        assert client.submit(neg, 2).result() == -2
+
+
+def test_admission_control():
+    admission = AdmissionControl(max_concurrent_per_tenant=1, max_pending=2, timeout=0.01)
+    with admission.admit('user1'):
+        # Same tenant over its limit times out, other tenants are admitted
+        with pytest.raises(ResponderOverloadedException):
+            with admission.admit('user1'):
+                pass
+        with admission.admit('user2'):
+            # Queue full
+            with pytest.raises(ResponderOverloadedException):
+                with admission.admit('user3'):
+                    pass
+    with admission.admit('user1'):
+        pass
+    assert admission._pending == 0
@@ -0,0 +1,27 @@
+# Copyright 2018 BLEMUNDSBURY AI LIMITED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Dask worker preload loading the machine reader when the worker starts, rather than on its first task:
+
+    dask-worker <scheduler address> --preload cape_responder.worker_preload
+"""
+
+from logging import info
+from cape_responder.task_manager import initialize_worker
+
+
+def dask_setup(worker):
+    info(f"Loading the machine reader on worker {worker.address}")
+    initialize_worker()
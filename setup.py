@@ -37,8 +37,8 @@ setup(
     author_email='contact@bloomsbury.ai',
     packages=PACKAGES,
     include_package_data=True,
-    install_requires=['dask==0.15.4',
-                      'distributed==1.19.2',
+    install_requires=['dask==0.17.0',
+                      'distributed==1.21.0',
                       'numpy==1.15.0',
                       'pytest==3.6.4',
                       'cape_machine_reader==' + _get_github_sha(